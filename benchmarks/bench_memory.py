@@ -0,0 +1,75 @@
+"""
+bench_memory.py - 测量每条交易的内存占用（tracemalloc），对比普通 dataclass 与当前 __slots__ + id 驻留实现
+运行： python benchmarks/bench_memory.py [条数]
+"""
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.models import Transaction, TxType  # noqa: E402
+from src import utils  # noqa: E402
+
+# per-transaction budget for the in-memory representation, excluding indexes
+BUDGET_BYTES = 320
+
+
+@dataclass
+class PlainTransaction:
+    # the pre-slots layout, for comparison
+    id: str
+    type: TxType
+    amount: int
+    category_id: str
+    account_id: str
+    datetime: str
+    remark: str = ""
+    receipt_path: str = ""
+
+    @staticmethod
+    def from_dict(d):
+        return PlainTransaction(d["id"], TxType(d["type"]), d["amount_cents"], d["category_id"],
+                                d["account_id"], d["datetime"], d["remark"], d["receipt_path"])
+
+
+def make_records(n: int):
+    cats = [utils.generate_uuid() for _ in range(50)]
+    accts = [utils.generate_uuid() for _ in range(10)]
+    for i in range(n):
+        # fresh strings per record, as json.loads would produce them
+        yield {
+            "id": utils.generate_uuid(),
+            "type": "expense" if i % 3 else "income",
+            "amount_cents": (i % 1000) * 100 + 50,
+            "category_id": "".join(cats[i % len(cats)]),
+            "account_id": "".join(accts[i % len(accts)]),
+            "datetime": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T12:00:00",
+            "remark": "",
+            "receipt_path": "",
+        }
+
+
+def measure(factory, n: int) -> float:
+    # retained bytes per object after the source records are gone, strings included
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [factory(r) for r in make_records(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(objs)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    plain = measure(PlainTransaction.from_dict, n)
+    compact = measure(Transaction.from_dict, n)
+    print(f"transactions: {n}")
+    print(f"plain dataclass : {plain:8.1f} bytes/tx")
+    print(f"slots + interned: {compact:8.1f} bytes/tx")
+    print(f"budget          : {BUDGET_BYTES:8d} bytes/tx -> {'OK' if compact <= BUDGET_BYTES else 'OVER'}")
+
+
+if __name__ == "__main__":
+    main()
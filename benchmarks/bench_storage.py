@@ -0,0 +1,84 @@
+"""
+bench_storage.py - 对比 JSON 与二进制 (binfmt) 数据格式的保存/加载耗时与体积
+运行： python benchmarks/bench_storage.py [条数]
+加密层 (AES-GCM) 对两种格式相同，这里只比较序列化/反序列化与明文体积；
+安装了 cryptography 时额外测一次完整的 LocalStorage.save/load。
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.models import Transaction, Account, Category, AppLock, DataBundle, TxType  # noqa: E402
+from src import binfmt, utils  # noqa: E402
+
+
+def make_dataset(n: int):
+    accts = [Account(id=utils.generate_uuid(), name=f"账户{i}") for i in range(10)]
+    cats = [Category(id=utils.generate_uuid(), name=f"分类{i}") for i in range(50)]
+    txs = [
+        Transaction(
+            id=utils.generate_uuid(),
+            type=TxType.Expense if i % 3 else TxType.Income,
+            amount=(i % 1000) * 100 + 25,
+            category_id=cats[i % len(cats)].id,
+            account_id=accts[i % len(accts)].id,
+            datetime=f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T12:00:00",
+            remark="午饭" if i % 5 == 0 else "",
+        )
+        for i in range(n)
+    ]
+    return txs, accts, cats, AppLock()
+
+
+def json_dumps(txs, accts, cats, applock) -> bytes:
+    return DataBundle(
+        transactions=[t.to_dict() for t in txs],
+        accounts=[a.to_dict() for a in accts],
+        categories=[c.to_dict() for c in cats],
+        applock=applock.to_dict(),
+    ).to_json().encode("utf-8")
+
+
+def json_loads(data: bytes):
+    bundle = DataBundle.from_json(data.decode("utf-8"))
+    return ([Transaction.from_dict(t) for t in bundle.transactions],
+            [Account.from_dict(a) for a in bundle.accounts],
+            [Category.from_dict(c) for c in bundle.categories],
+            AppLock.from_dict(bundle.applock))
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    data = make_dataset(n)
+    print(f"transactions: {n}")
+    print(f"{'format':8} {'save s':>8} {'load s':>8} {'size MB':>9}")
+    for name, dumps, loads in (("json", json_dumps, json_loads), ("binary", binfmt.dumps, binfmt.loads)):
+        blob, t_save = timed(dumps, *data)
+        loaded, t_load = timed(loads, blob)
+        assert [t.to_dict() for t in loaded[0]] == [t.to_dict() for t in data[0]]
+        print(f"{name:8} {t_save:8.3f} {t_load:8.3f} {len(blob) / 1e6:9.1f}")
+
+    try:
+        from src.storage import LocalStorage, FORMAT_JSON, FORMAT_BINARY
+    except ImportError:
+        return
+    print("\nLocalStorage (encrypted, incl. PBKDF2):")
+    with tempfile.TemporaryDirectory() as d:
+        for fmt in (FORMAT_JSON, FORMAT_BINARY):
+            st = LocalStorage(os.path.join(d, f"{fmt}.enc"), "bench", fmt)
+            _, t_save = timed(st.save, *data)
+            _, t_load = timed(st.load)
+            print(f"{fmt:8} {t_save:8.3f} {t_load:8.3f} {os.path.getsize(st.path) / 1e6:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+autosave.py - 后台自动保存：变更后最多等待 interval 秒，在后台线程完成序列化 + 加密 + 写文件，交互循环不被阻塞
+Only the snapshot (list copies under TransactionService.lock) and the final journal
+checkpoint hold the lock; the slow part runs while the CLI keeps mutating. Mutations made
+meanwhile are journaled against both the old and the new checkpoint (begin_checkpoint).
+"""
+import copy
+import threading
+import time
+from typing import Optional
+from .models import AppLock
+from .services import TransactionService
+from .storage import StorageBackend
+from . import checkpoints
+
+DEFAULT_INTERVAL = 5.0
+
+
+class AutoSaver:
+    def __init__(self, storage: StorageBackend, tx_service: TransactionService, applock: AppLock,
+                 interval: float = DEFAULT_INTERVAL):
+        self.storage = storage
+        self.tx_service = tx_service
+        self.applock = applock
+        self.interval = interval
+        self.saves = 0  # completed saves
+        self.last_error: Optional[Exception] = None
+        self._cond = threading.Condition()
+        self._dirty_since: Optional[float] = None
+        self._flush = False
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self):
+        """Schedule a save; changes within the next interval seconds share it (debounce)."""
+        with self._cond:
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+                self._cond.notify_all()
+
+    def flush(self):
+        """Save now (whether or not marked dirty) and wait for it; raises if it failed."""
+        with self._cond:
+            target = self.saves + 1
+            self._dirty_since = self._dirty_since or time.monotonic()
+            self._flush = True
+            self._cond.notify_all()
+            while self.saves < target:
+                if not self._thread.is_alive():
+                    raise RuntimeError("autosave worker is not running")
+                # timed, so a worker that died without notifying cannot hang the caller
+                self._cond.wait(1.0)
+            if self.last_error is not None:
+                raise self.last_error
+
+    def close(self):
+        """Stop the worker after a pending save, if any."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._dirty_since is None and not self._stop:
+                    self._cond.wait()
+                if self._dirty_since is None:
+                    return
+                deadline = self._dirty_since + self.interval
+                while not (self._flush or self._stop) and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                self._dirty_since = None
+                self._flush = False
+            try:
+                error = self._save()
+            except Exception as e:
+                # whatever failed, the worker keeps running and flush() gets its answer
+                error = e
+            with self._cond:
+                self.last_error = error
+                self.saves += 1
+                self._cond.notify_all()
+
+    def _save(self) -> Optional[Exception]:
+        svc = self.tx_service
+        with svc.lock:
+            txs, accounts, categories, changes = svc.snapshot()
+            try:
+                self.storage.begin_checkpoint()
+            except Exception:
+                svc.changes[:0] = changes
+                raise
+        applock = copy.copy(self.applock)
+        try:
+            self.storage.save(txs, accounts, categories, applock, changes, checkpoint=False)
+        except Exception as e:
+            with svc.lock:
+                # nothing was checkpointed: hand the changes back for the next attempt
+                svc.changes[:0] = changes
+            return e
+        with svc.lock:
+            self.storage.finish_checkpoint(list(svc.changes))
+            # the file matches memory exactly: copy the balance checkpoints to store alongside
+            extra = svc.checkpoints.to_dict() if not svc.changes else None
+        if extra is not None:
+            # serialized, encrypted and written without the lock; a mutation made meanwhile
+            # is journaled, which makes load_extra() ignore this copy
+            self.storage.save_extra(checkpoints.EXTRA_NAME, extra)
+        return None
@@ -0,0 +1,187 @@
+"""
+binfmt.py - 紧凑二进制数据格式（JSON 的替代），在加密前的明文层使用
+Layout (little-endian):
+  4 bytes magic: b'FAB1'
+  2 bytes version, 2 bytes reserved
+  u32 + UTF-8 JSON: accounts / categories / applock (small, kept as dicts)
+  u32 transaction count n, then one section per column:
+    type      n bytes (0 income, 1 expense)
+    amount    n int64 cents (version 1: n float64, converted on read)
+    category  string table + n u32 codes
+    account   string table + n u32 codes
+    id, datetime, remark, receipt_path   string columns
+  string column: u32 char count, n u32 end offsets (in characters), u32 byte length, UTF-8 text
+  string table:  u32 count + string column
+"""
+import json
+import struct
+import sys
+from array import array
+from typing import List, Tuple, Dict
+from .models import Transaction, Account, Category, AppLock, TxType, intern_id
+from . import money
+
+MAGIC = b"FAB1"
+VERSION = 2
+
+_TYPES = [TxType.Income, TxType.Expense]
+_TYPE_CODES = {TxType.Income: 0, TxType.Expense: 1}
+_U32 = struct.Struct("<I")
+_HEADER = struct.Struct("<4sHH")
+
+
+def is_binary(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def _le(a: array) -> array:
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+class Writer:
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def u32(self, v: int):
+        self.parts.append(_U32.pack(v))
+
+    def blob(self, b: bytes):
+        self.u32(len(b))
+        self.parts.append(b)
+
+    def array(self, a: array):
+        self.parts.append(_le(a).tobytes())
+
+    def strings(self, values: List[str]):
+        ends = array("I")
+        pos = 0
+        for v in values:
+            pos += len(v)
+            ends.append(pos)
+        self.u32(pos)
+        self.array(ends)
+        self.blob("".join(values).encode("utf-8", "surrogatepass"))
+
+    def table(self, values: List[str]):
+        self.u32(len(values))
+        self.strings(values)
+
+    def transactions(self, txs: List[Transaction]):
+        self.u32(len(txs))
+        self.parts.append(bytes(_TYPE_CODES[t.type] for t in txs))
+        self.array(array("q", (t.amount for t in txs)))
+        for values in ([t.category_id for t in txs], [t.account_id for t in txs]):
+            table, codes = _encode_codes(values)
+            self.table(table)
+            self.array(codes)
+        self.strings([t.id for t in txs])
+        self.strings([t.datetime for t in txs])
+        self.strings([t.remark for t in txs])
+        self.strings([t.receipt_path for t in txs])
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+
+class Reader:
+    def __init__(self, data: bytes, pos: int = 0, version: int = VERSION):
+        self.data = memoryview(data)
+        self.pos = pos
+        self.version = version  # of the writer; version 1 stored float amounts
+
+    def u32(self) -> int:
+        v = _U32.unpack_from(self.data, self.pos)[0]
+        self.pos += 4
+        return v
+
+    def blob(self) -> bytes:
+        n = self.u32()
+        b = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return bytes(b)
+
+    def array(self, typecode: str, n: int) -> array:
+        a = array(typecode)
+        size = a.itemsize * n
+        a.frombytes(self.data[self.pos:self.pos + size])
+        self.pos += size
+        return _le(a)
+
+    def strings(self, n: int) -> List[str]:
+        self.u32()  # total chars, informational
+        ends = self.array("I", n)
+        text = self.blob().decode("utf-8", "surrogatepass")
+        out = []
+        start = 0
+        for e in ends:
+            out.append(text[start:e])
+            start = e
+        return out
+
+    def table(self) -> List[str]:
+        return self.strings(self.u32())
+
+    def raw(self, n: int) -> bytes:
+        b = bytes(self.data[self.pos:self.pos + n])
+        self.pos += n
+        return b
+
+    def transactions(self) -> List[Transaction]:
+        n = self.u32()
+        types = self.raw(n)
+        if self.version < 2:
+            amounts = [money.from_float(a) for a in self.array("d", n)]
+        else:
+            amounts = self.array("q", n)
+        columns = []
+        for _ in range(2):
+            table = [intern_id(v) for v in self.table()]
+            codes = self.array("I", n)
+            columns.append([table[c] for c in codes])
+        cat_ids, acct_ids = columns
+        ids = self.strings(n)
+        dts = self.strings(n)
+        remarks = self.strings(n)
+        receipts = self.strings(n)
+        type_values = [_TYPES[c] for c in types]
+        return [Transaction(*row) for row in zip(ids, type_values, amounts, cat_ids, acct_ids, dts, remarks, receipts)]
+
+
+def _encode_codes(values: List[str]) -> Tuple[List[str], array]:
+    codes: Dict[str, int] = {}
+    out = array("I")
+    for v in values:
+        c = codes.get(v)
+        if c is None:
+            c = codes[v] = len(codes)
+        out.append(c)
+    return list(codes), out
+
+
+def dumps(txs: List[Transaction], accts: List[Account], cats: List[Category], applock: AppLock) -> bytes:
+    w = Writer()
+    w.parts.append(_HEADER.pack(MAGIC, VERSION, 0))
+    meta = {
+        "accounts": [a.to_dict() for a in accts],
+        "categories": [c.to_dict() for c in cats],
+        "applock": applock.to_dict(),
+    }
+    w.blob(json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    w.transactions(txs)
+    return w.getvalue()
+
+
+def loads(data: bytes) -> Tuple[List[Transaction], List[Account], List[Category], AppLock]:
+    magic, version, _ = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Invalid binary payload (magic mismatch)")
+    if version > VERSION:
+        raise ValueError(f"Unsupported binary payload version {version}")
+    r = Reader(data, _HEADER.size, version)
+    meta = json.loads(r.blob().decode("utf-8"))
+    accts = [Account.from_dict(a) for a in meta.get("accounts", [])]
+    cats = [Category.from_dict(c) for c in meta.get("categories", [])]
+    applock = AppLock.from_dict(meta["applock"]) if meta.get("applock") else AppLock()
+    return r.transactions(), accts, cats, applock
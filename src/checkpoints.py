@@ -0,0 +1,160 @@
+"""
+checkpoints.py - 账户余额检查点：每月月初记录各账户相对初始余额的累计变动，
+历史余额 = 最近的检查点 + 当月少量交易重放；修改旧交易只影响该日期之后的检查点。
+"""
+import re
+from bisect import bisect_right
+from typing import List, Optional, Dict
+from .models import Transaction, TxType
+from . import money
+
+EXTRA_NAME = "checkpoints"  # StorageBackend.save_extra / load_extra key
+_MONTH_RE = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+
+
+def _month(dt: str) -> Optional[str]:
+    m = dt[:7]
+    return m if _MONTH_RE.fullmatch(m) else None
+
+
+def _next_month(month: str) -> str:
+    y, m = int(month[:4]), int(month[5:7])
+    return f"{y + 1:04d}-01" if m == 12 else f"{y:04d}-{m + 1:02d}"
+
+
+def _signed(tx: Transaction) -> money.Cents:
+    return tx.amount if tx.type == TxType.Income else -tx.amount
+
+
+class BalanceCheckpoints:
+    """
+    Ledger view. _deltas[k][account_id] is the signed sum of every transaction with
+    datetime < _months[k] (the string "YYYY-MM" sorts before every datetime in that
+    month), for consecutive months spanning the ledger. Deltas rather than balances
+    keep checkpoints valid when accounts are added or their initial balance changes.
+    Only [0, _valid) is computed; the rest is filled in on demand by one forward scan.
+    """
+
+    def __init__(self, ledger, data: Optional[Dict] = None):
+        self.ledger = ledger
+        self._months: List[str] = []
+        self._deltas: List[Dict[str, money.Cents]] = []
+        self._valid = 0
+        if data is None or not self._restore(data):
+            self.rebuild()
+
+    # --- ledger view ---
+
+    def rebuild(self):
+        i, j = self.ledger.index.date_bounds()
+        first = self._edge_month(range(i, j))
+        last = self._edge_month(range(j - 1, i - 1, -1))
+        self._months = []
+        if first:
+            m = first
+            while m <= last:
+                self._months.append(m)
+                m = _next_month(m)
+        self._deltas = [{} for _ in self._months]
+        self._valid = 0
+
+    def _edge_month(self, positions) -> Optional[str]:
+        # first canonical month in date order; odd strings like "2024" sort at the edges
+        index = self.ledger.index
+        for p in positions:
+            m = _month(index.date_slice(p, p + 1)[0].datetime)
+            if m:
+                return m
+        return None
+
+    def add(self, tx: Transaction):
+        self._update(tx, 1)
+
+    def remove(self, tx: Transaction):
+        self._update(tx, -1)
+
+    def _update(self, tx: Transaction, sign: int):
+        month = _month(tx.datetime)
+        if month is not None and not self._months:
+            self._months.append(month)
+            self._deltas.append({})
+        elif month is not None and month < self._months[0]:
+            # grow at the front; those checkpoints are computed on the next query
+            front = []
+            m = month
+            while m < self._months[0]:
+                front.append(m)
+                m = _next_month(m)
+            self._months[:0] = front
+            self._deltas[:0] = [{} for _ in front]
+            self._valid = 0
+        if month is not None:
+            m = self._months[-1]
+            while m < month:
+                m = _next_month(m)
+                self._months.append(m)
+                self._deltas.append({})
+        # only checkpoints after the transaction's date change; later ones not yet
+        # computed will pick it up from the date index
+        k = bisect_right(self._months, tx.datetime)
+        delta = sign * _signed(tx)
+        for d in self._deltas[k:self._valid]:
+            d[tx.account_id] = d.get(tx.account_id, 0) + delta
+
+    # --- queries ---
+
+    def _extend(self, n: int):
+        index = self.ledger.index
+        pos = index.date_position(self._months[self._valid - 1]) if self._valid else 0
+        while self._valid < n:
+            k = self._valid
+            d = dict(self._deltas[k - 1]) if k else {}
+            end = index.date_position(self._months[k])
+            for t in index.date_slice(pos, end):
+                d[t.account_id] = d.get(t.account_id, 0) + _signed(t)
+            self._deltas[k] = d
+            pos = end
+            self._valid += 1
+
+    def delta_at(self, account_id: str, date_iso: str) -> money.Cents:
+        """Signed sum of the account's transactions with datetime <= date_iso."""
+        index = self.ledger.index
+        k = bisect_right(self._months, date_iso) - 1
+        if k >= 0:
+            self._extend(k + 1)
+            base = self._deltas[k].get(account_id, 0)
+            start = index.date_position(self._months[k])
+        else:
+            base, start = 0, 0
+        _, end = index.date_bounds("", date_iso)
+        for t in index.date_slice(start, end):
+            if t.account_id == account_id:
+                base += _signed(t)
+        return base
+
+    def balance_at(self, account_id: str, date_iso: str) -> Optional[money.Cents]:
+        """Balance after every transaction up to and including date_iso (same string
+        semantics as date ranges); None for an unknown account."""
+        a = self.ledger.index.account(account_id)
+        if a is None:
+            return None
+        if not date_iso:
+            return a.current_balance
+        return a.initial_balance + self.delta_at(account_id, date_iso)
+
+    # --- persistence ---
+
+    def to_dict(self) -> Dict:
+        """A copy, so it can be serialized after TransactionService.lock is released."""
+        self._extend(len(self._months))
+        return {"months": list(self._months), "deltas": [dict(d) for d in self._deltas]}
+
+    def _restore(self, data: Dict) -> bool:
+        months = data.get("months")
+        deltas = data.get("deltas")
+        if not isinstance(months, list) or not isinstance(deltas, list) or len(months) != len(deltas):
+            return False
+        self._months = list(months)
+        self._deltas = [{k: int(v) for k, v in d.items()} for d in deltas]
+        self._valid = len(self._months)
+        return True
@@ -0,0 +1,292 @@
+"""
+cli.py - 非交互的批处理入口：只加载一次数据，按顺序执行多个子命令（导入/导出/统计/报表/备份/从标准输入添加交易），最后只保存一次
+运行： python -m src.cli [--data data.enc] [--password-fd 3] import a.csv b.csv + stats --start 2024-01-01 + backup
+子命令之间用单独的 "+" 分隔。密码取自环境变量 FINANCEAPP_PASSWORD 或 --password-fd 指定的文件描述符（读取第一行）；
+启用应用锁时需在 FINANCEAPP_APPLOCK_PASSWORD 中提供应用锁密码。每个子命令在标准输出打印一行 JSON 结果。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List, Optional, Dict
+from .models import Transaction, TxType
+from .ledger import Ledger
+from .storage import open_storage, StorageBackend, FORMAT_SEGMENTED
+from .services import TransactionService, StatisticsService, ExportService, NameResolver, MAX_REPORTED_ERRORS
+from .reports import ReportEngine, PERIODS
+from . import utils, encryption, money, checkpoints
+
+SEPARATOR = "+"
+PASSWORD_ENV = "FINANCEAPP_PASSWORD"
+APPLOCK_ENV = "FINANCEAPP_APPLOCK_PASSWORD"
+MAX_WRONG_ATTEMPTS = 5
+LOCK_SECONDS = 600
+
+
+class CliError(Exception):
+    pass
+
+
+class Session:
+    """One opened data file: transactions are materialized on first use, and save()
+    writes everything changed since the load (or the previous save) at once."""
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+        self.lazy, self.accounts, self.categories, self.applock = storage.open_lazy()
+        self.tx_service: Optional[TransactionService] = None
+        self._version = 0
+
+    @property
+    def service(self) -> TransactionService:
+        if self.tx_service is None:
+            storage = self.storage
+            ledger = Ledger(self.lazy.materialize(), self.accounts, self.categories)
+            self.tx_service = TransactionService(ledger, journal=storage.journal if storage.journal.ready else None,
+                                                 trust_balances=self.lazy.balances_current,
+                                                 checkpoints=storage.load_extra(checkpoints.EXTRA_NAME))
+            self._version = ledger.version
+        return self.tx_service
+
+    @property
+    def dirty(self) -> bool:
+        svc = self.tx_service
+        return svc is not None and (bool(svc.changes) or svc.ledger.version != self._version)
+
+    def save(self):
+        svc = self.tx_service
+        self.storage.save(svc.txs, self.accounts, self.categories, self.applock, svc.take_changes())
+        self.storage.save_extra(checkpoints.EXTRA_NAME, svc.checkpoints.to_dict())
+        self._version = svc.ledger.version
+
+    def save_meta(self):
+        """Accounts, categories and app lock; a full save when the backend cannot write
+        them alone (legacy formats, after a journal replay)."""
+        if not self.storage.save_meta(self.accounts, self.categories, self.applock):
+            self.service  # materialized for the full save
+            self.save()
+
+
+# --- commands: each returns the JSON-able result line ---
+
+def cmd_import(session: Session, args) -> Dict:
+    svc = session.service
+    resolver = NameResolver(svc, auto_create=args.create)
+    # one path or many: the same per-file reports and totals
+    files = ExportService.import_files_into(svc, args.paths, workers=args.workers, resolver=resolver)
+    return {"rows": sum(f["rows"] for f in files), "added": sum(f["added"] for f in files),
+            "skipped": sum(f["skipped"] for f in files), "error_count": sum(f["error_count"] for f in files),
+            "created_accounts": len(resolver.created_accounts),
+            "created_categories": len(resolver.created_categories),
+            "unresolved": resolver.unresolved, "files": files}
+
+
+def cmd_add(session: Session, args) -> Dict:
+    """JSON lines on stdin: type, amount (decimal string preferred), category, account
+    (names or ids), datetime, remark, receipt, id; all added as one batch."""
+    svc = session.service
+    resolver = NameResolver(svc, auto_create=args.create)
+    txs: List[Transaction] = []
+    errors = []
+    error_count = 0
+    for n, line in enumerate(sys.stdin, 1):
+        if not line.strip():
+            continue
+        try:
+            d = json.loads(line)
+            txs.append(Transaction(
+                id=str(d.get("id") or ""),
+                type=TxType(d.get("type") or TxType.Expense.value),
+                amount=money.to_cents(d.get("amount", "0")),
+                category_id=str(d.get("category") or ""),
+                account_id=str(d.get("account") or ""),
+                datetime=d.get("datetime") or utils.current_datetime_iso(),
+                remark=d.get("remark") or "",
+                receipt_path=d.get("receipt") or "",
+            ))
+        except (ValueError, TypeError, AttributeError) as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"line {n}: {e}")
+    added, skipped = svc.add_transactions(resolver.resolve_all(txs))
+    return {"added": len(added), "skipped": skipped, "errors": errors, "error_count": error_count,
+            "unresolved": resolver.unresolved}
+
+
+def cmd_export(session: Session, args) -> Dict:
+    svc = session.service
+    txs = svc.index.date_range(args.start, args.end) if args.start or args.end else svc.txs
+    if not ExportService.export_transactions_to_csv(txs, svc.categories, svc.accounts, args.path, index=svc.index):
+        raise CliError(f"export to {args.path} failed")
+    return {"path": args.path, "rows": len(txs)}
+
+
+def cmd_stats(session: Session, args) -> Dict:
+    svc = session.service
+    storage = session.storage
+    stats = StatisticsService(svc.ledger, svc.rollups, sql=storage if storage.pushdown else None)
+    inc, exp = stats.calculate_totals(args.start, args.end)
+    top = stats.top_categories(TxType(args.type), args.top, args.start, args.end)
+    return {"income": money.format_cents(inc), "expense": money.format_cents(exp),
+            "net": money.format_cents(inc - exp),
+            "top_categories": [{"category_id": s["category_id"], "category_name": s["category_name"],
+                                "total": money.format_cents(s["total"])} for s in top]}
+
+
+def cmd_report(session: Session, args) -> Dict:
+    rows = ReportEngine(session.service.ledger).export_csv(args.path, args.period, args.start, args.end)
+    return {"path": args.path, "rows": rows}
+
+
+def cmd_backup(session: Session, args) -> Dict:
+    # the backup copies the data file, so changes made earlier in the batch are saved first
+    if session.dirty:
+        session.save()
+    path = args.path
+    if not path:
+        root, ext = os.path.splitext(session.storage.path)
+        path = f"{root}_backup_{int(time.time())}{ext}"
+    if not session.storage.backup(path):
+        raise CliError(f"backup to {path} failed")
+    return {"path": path}
+
+
+# --- argument parsing ---
+
+def _add_range(p: argparse.ArgumentParser):
+    p.add_argument("--start", default="", help="开始时间 (含)，空不限制")
+    p.add_argument("--end", default="", help="结束时间 (含)，空不限制")
+
+
+def build_parsers():
+    """(global options parser, parser for one command)"""
+    main = argparse.ArgumentParser(prog="python -m src.cli", description="记账数据批处理：一次加载、依次执行、一次保存")
+    main.add_argument("--data", default=os.environ.get("FINANCEAPP_DATA", "data.enc"),
+                      help="数据文件（.db / .sqlite 使用 SQLite 后端）")
+    main.add_argument("--password-fd", type=int, default=None,
+                      help=f"从该文件描述符读取密码（第一行），默认取环境变量 {PASSWORD_ENV}")
+    main.add_argument("commands", nargs=argparse.REMAINDER,
+                      help=f"子命令，多个之间用 {SEPARATOR!r} 分隔: import / add / export / stats / report / backup")
+
+    cmd = argparse.ArgumentParser(prog="python -m src.cli ...", add_help=False)
+    sub = cmd.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="导入 CSV（多个文件并行解析）")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--create", action="store_true", help="自动创建不存在的分类/账户")
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(run=cmd_import)
+    p = sub.add_parser("add", help="从标准输入读取 JSON Lines 交易")
+    p.add_argument("--create", action="store_true", help="自动创建不存在的分类/账户")
+    p.set_defaults(run=cmd_add)
+    p = sub.add_parser("export", help="导出 CSV")
+    p.add_argument("path")
+    _add_range(p)
+    p.set_defaults(run=cmd_export)
+    p = sub.add_parser("stats", help="收支合计与分类排行")
+    _add_range(p)
+    p.add_argument("--top", type=int, default=10)
+    p.add_argument("--type", choices=[t.value for t in TxType], default=TxType.Expense.value)
+    p.set_defaults(run=cmd_stats)
+    p = sub.add_parser("report", help="按日/周/月导出汇总报表 CSV")
+    p.add_argument("path")
+    p.add_argument("--period", choices=PERIODS, default="month")
+    _add_range(p)
+    p.set_defaults(run=cmd_report)
+    p = sub.add_parser("backup", help="备份数据文件（先保存本次的变更）")
+    p.add_argument("path", nargs="?", default="")
+    p.set_defaults(run=cmd_backup)
+    return main, cmd
+
+
+def split_commands(tokens: List[str]) -> List[List[str]]:
+    out = [[]]
+    for tok in tokens:
+        if tok == SEPARATOR:
+            out.append([])
+        else:
+            out[-1].append(tok)
+    return [c for c in out if c]
+
+
+def read_password(fd: Optional[int]) -> str:
+    if fd is None:
+        password = os.environ.get(PASSWORD_ENV)
+        if password is None:
+            raise CliError(f"no password: set {PASSWORD_ENV} or pass --password-fd")
+        return password
+    with os.fdopen(fd, "r", encoding="utf-8", closefd=False) as f:
+        return f.readline().rstrip("\r\n")
+
+
+def check_applock(session: Session):
+    """Same rules as the interactive prompt: wrong passwords count towards a temporary lock."""
+    applock = session.applock
+    if not applock.enabled:
+        return
+    now = int(time.time())
+    if applock.lock_until > now:
+        raise CliError(f"app locked until {time.ctime(applock.lock_until)}")
+    given = os.environ.get(APPLOCK_ENV)
+    if given is not None and encryption.hash_password_hex(given) == applock.password_hash:
+        if applock.wrong_attempts:
+            applock.wrong_attempts = 0
+            session.save_meta()
+        return
+    if given is None:
+        raise CliError(f"app lock is enabled: set {APPLOCK_ENV}")
+    applock.wrong_attempts += 1
+    if applock.wrong_attempts >= MAX_WRONG_ATTEMPTS:
+        applock.lock_until = now + LOCK_SECONDS
+    session.save_meta()
+    raise CliError(f"wrong app lock password ({applock.wrong_attempts}/{MAX_WRONG_ATTEMPTS})")
+
+
+def _emit(command: str, result: Dict, ok: bool = True):
+    print(json.dumps({"command": command, "ok": ok, **result}, ensure_ascii=False), flush=True)
+
+
+def main(argv=None) -> int:
+    """Exit status: 0 all commands succeeded, 1 a command failed (the ones before it are
+    still saved), 2 usage error or the data could not be opened."""
+    main_parser, cmd_parser = build_parsers()
+    args = main_parser.parse_args(sys.argv[1:] if argv is None else argv)
+    commands = []
+    try:
+        for tokens in split_commands(args.commands):
+            commands.append(cmd_parser.parse_args(tokens))
+    except SystemExit:
+        return 2
+    if not commands:
+        main_parser.print_usage(sys.stderr)
+        return 2
+    try:
+        password = read_password(args.password_fd)
+        storage = open_storage(args.data, password, FORMAT_SEGMENTED)
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    status = 0
+    try:
+        try:
+            session = Session(storage)
+            check_applock(session)
+        except Exception as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        for c in commands:
+            try:
+                _emit(c.command, c.run(session, c))
+            except Exception as e:
+                _emit(c.command, {"error": str(e)}, ok=False)
+                status = 1
+                break
+        if session.dirty:
+            session.save()
+    finally:
+        storage.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+columnar.py - 可选的列式交易视图（需要 numpy）：金额 int64（分）、时间 epoch 秒 int64、分类/账户/类型字典编码，
+供 StatisticsService 做向量化汇总、按分类分组与区间掩码。
+"""
+import calendar
+import re
+import time
+from typing import List, Optional, Dict, Tuple
+from .models import Transaction, TxType
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+_TYPE_CODES = {TxType.Income: 0, TxType.Expense: 1}
+_ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+_DATE_FORMAT = "%Y-%m-%d"
+_ISO_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}")
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _epoch(s: str, fmt: str) -> Optional[int]:
+    # only zero-padded forms sort the same as strings and as timestamps
+    if not (_ISO_RE if fmt == _ISO_FORMAT else _DATE_RE).fullmatch(s):
+        return None
+    try:
+        return calendar.timegm(time.strptime(s, fmt))
+    except ValueError:
+        return None
+
+
+class _Dictionary:
+    """str <-> small int code, codes are never reused."""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, value: str) -> int:
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+
+class ColumnarStore:
+    """
+    Rows are appended in mutation order and tombstoned on removal (compacted when
+    more than half are dead). Range bounds keep the string semantics of the object
+    path: only rows whose datetime is canonical "YYYY-MM-DDTHH:MM:SS" can be compared
+    by epoch, so queries return None (caller falls back) while irregular datetimes
+    are present or a bound is neither a canonical datetime nor a plain date.
+    """
+
+    def __init__(self, txs: List[Transaction]):
+        if np is None:
+            raise RuntimeError("numpy is required for the columnar store")
+        self.txs = txs
+        self.rebuild()
+
+    def rebuild(self):
+        n = max(len(self.txs), 16)
+        self.amount = np.zeros(n, dtype=np.int64)
+        self.epoch = np.zeros(n, dtype=np.int64)
+        self.category = np.zeros(n, dtype=np.int32)
+        self.account = np.zeros(n, dtype=np.int32)
+        self.type = np.zeros(n, dtype=np.int8)
+        self.alive = np.zeros(n, dtype=bool)
+        self.categories = _Dictionary()
+        self.accounts = _Dictionary()
+        self._rows: Dict[int, int] = {}  # id(tx) -> row
+        self._irregular: Dict[int, int] = {}  # rows whose datetime is not canonical
+        self._size = 0
+        for t in self.txs:
+            self.add(t)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # --- maintenance ---
+
+    def _grow(self):
+        cap = len(self.amount) * 2
+        for name in ("amount", "epoch", "category", "account", "type", "alive"):
+            old = getattr(self, name)
+            new = np.zeros(cap, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, tx: Transaction):
+        if self._size == len(self.amount):
+            if len(self._rows) * 2 < self._size:
+                self._compact()
+            else:
+                self._grow()
+        r = self._size
+        self._size += 1
+        ep = _epoch(tx.datetime, _ISO_FORMAT)
+        if ep is None:
+            self._irregular[id(tx)] = r
+        self.amount[r] = tx.amount
+        self.epoch[r] = ep or 0
+        self.category[r] = self.categories.encode(tx.category_id)
+        self.account[r] = self.accounts.encode(tx.account_id)
+        self.type[r] = _TYPE_CODES[tx.type]
+        self.alive[r] = True
+        self._rows[id(tx)] = r
+
+    def remove(self, tx: Transaction):
+        r = self._rows.pop(id(tx), None)
+        if r is None:
+            return
+        self._irregular.pop(id(tx), None)
+        self.alive[r] = False
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive[:self._size])
+        remap = np.empty(self._size, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        for name in ("amount", "epoch", "category", "account", "type", "alive"):
+            col = getattr(self, name)
+            col[:len(keep)] = col[keep]
+            col[len(keep):] = 0
+        self._rows = {k: int(remap[r]) for k, r in self._rows.items()}
+        self._irregular = {k: int(remap[r]) for k, r in self._irregular.items()}
+        self._size = len(keep)
+
+    # --- queries ---
+
+    @staticmethod
+    def _bound(s: str, is_end: bool) -> Optional[int]:
+        if len(s) == 19:
+            return _epoch(s, _ISO_FORMAT)
+        if len(s) == 10:
+            ep = _epoch(s, _DATE_FORMAT)
+            # a canonical datetime on that day sorts after the bare date string
+            return None if ep is None else (ep - 1 if is_end else ep)
+        return None
+
+    def mask(self, start_iso: str = "", end_iso: str = ""):
+        """Boolean mask over live rows in [start_iso, end_iso], or None if it cannot be exact."""
+        m = self.alive[:self._size].copy()
+        if not start_iso and not end_iso:
+            return m
+        if self._irregular:
+            return None
+        ep = self.epoch[:self._size]
+        if start_iso:
+            lo = self._bound(start_iso, False)
+            if lo is None:
+                return None
+            m &= ep >= lo
+        if end_iso:
+            hi = self._bound(end_iso, True)
+            if hi is None:
+                return None
+            m &= ep <= hi
+        return m
+
+    def totals(self, start_iso: str = "", end_iso: str = "") -> Optional[Tuple[int, int]]:
+        m = self.mask(start_iso, end_iso)
+        if m is None:
+            return None
+        amt = self.amount[:self._size]
+        types = self.type[:self._size]
+        inc = int(amt[m & (types == _TYPE_CODES[TxType.Income])].sum())
+        exp = int(amt[m & (types == _TYPE_CODES[TxType.Expense])].sum())
+        return inc, exp
+
+    def category_totals(self, tx_type: TxType, start_iso: str = "", end_iso: str = "") -> Optional[Dict[str, int]]:
+        m = self.mask(start_iso, end_iso)
+        if m is None:
+            return None
+        m &= self.type[:self._size] == _TYPE_CODES[tx_type]
+        codes = self.category[:self._size][m]
+        # bincount weights are float64; add.at keeps the int64 cents exact
+        sums = np.zeros(len(self.categories.values), dtype=np.int64)
+        np.add.at(sums, codes, self.amount[:self._size][m])
+        present = np.bincount(codes, minlength=len(self.categories.values)) > 0
+        values = self.categories.values
+        return {values[c]: int(sums[c]) for c in np.flatnonzero(present)}
@@ -5,18 +5,22 @@ File format (binary):
   16 bytes salt
   12 bytes nonce
   remaining: ciphertext (AES-GCM tag included)
+KeySession 缓存派生出的 key：每个 (password, salt) 只跑一次 PBKDF2，之后的保存只需 AES-GCM。
 """
 import os
+import threading
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
-from typing import Tuple
+from typing import Tuple, Dict, Optional
 
 MAGIC = b"FA1\x00"
 SALT_SIZE = 16
 NONCE_SIZE = 12
 ITERATIONS = 200_000  # PBKDF2 iterations
+# random 96-bit nonces: rotate to a fresh salt/key well before the GCM collision bound
+MAX_ENCRYPTIONS_PER_KEY = 1 << 24
 
 
 def derive_key(password: str, salt: bytes, iterations: int = ITERATIONS) -> bytes:
@@ -43,16 +47,113 @@ def encrypt(plaintext: bytes, password: str) -> bytes:
 
 
 def decrypt(blob: bytes, password: str) -> bytes:
+    salt, nonce, ct = _split(blob)
+    key = derive_key(password, salt)
+    aesgcm = AESGCM(key)
+    pt = aesgcm.decrypt(nonce, ct, None)
+    return pt
+
+
+def _split(blob: bytes) -> Tuple[bytes, bytes, bytes]:
     if not blob.startswith(MAGIC):
         raise ValueError("Invalid file format (magic mismatch)")
     pos = len(MAGIC)
     salt = blob[pos:pos + SALT_SIZE]; pos += SALT_SIZE
     nonce = blob[pos:pos + NONCE_SIZE]; pos += NONCE_SIZE
-    ct = blob[pos:]
-    key = derive_key(password, salt)
-    aesgcm = AESGCM(key)
-    pt = aesgcm.decrypt(nonce, ct, None)
-    return pt
+    return salt, nonce, blob[pos:]
+
+
+class KeySession:
+    """
+    Derives the AES key once per salt and reuses it, with a fresh random nonce per
+    encrypt. The salt read by decrypt() is adopted for later encrypts, so a
+    load/save cycle costs a single PBKDF2 run. Produces the same FA1 blobs as
+    encrypt()/decrypt(). The record formats (segments, journal, SQLite fields) encrypt
+    with seal(); every encryption counts towards max_encryptions for its salt, after
+    which salt picks a new one and exhausted() tells owners of the old salt to re-encrypt.
+    Call clear() (or use as a context manager) to drop the cached keys and overwrite the
+    password buffer.
+    """
+
+    def __init__(self, password: str, iterations: int = ITERATIONS,
+                 max_encryptions: int = MAX_ENCRYPTIONS_PER_KEY):
+        self._password = bytearray((password or "").encode("utf-8"))
+        self._iterations = iterations
+        self._max_encryptions = max_encryptions
+        self._keys: Dict[bytes, AESGCM] = {}
+        self._salt: Optional[bytes] = None
+        self._uses: Dict[bytes, int] = {}  # encryptions per salt, by every sealing path
+        self._lock = threading.Lock()
+
+    def _aead(self, salt: bytes) -> AESGCM:
+        aead = self._keys.get(salt)
+        if aead is None:
+            aead = self._keys[salt] = AESGCM(derive_key(bytes(self._password), salt, self._iterations))
+        return aead
+
+    @property
+    def salt(self) -> bytes:
+        """Salt used by the next encrypt(); picks a fresh one if none is active."""
+        with self._lock:
+            if self._salt is None or self._uses.get(self._salt, 0) >= self._max_encryptions:
+                if self._salt is not None:
+                    self._keys.pop(self._salt, None)
+                self._salt = os.urandom(SALT_SIZE)
+            return self._salt
+
+    def adopt_salt(self, salt: bytes):
+        """Use salt for later encrypts if none is active (its key is likely cached already)."""
+        with self._lock:
+            if self._salt is None:
+                self._salt = salt
+
+    def aead(self, salt: bytes) -> AESGCM:
+        """For decryption; encrypt through seal() so the use is counted."""
+        with self._lock:
+            return self._aead(salt)
+
+    def seal(self, salt: bytes, plaintext: bytes, aad: Optional[bytes] = None,
+             nonce: Optional[bytes] = None) -> bytes:
+        """nonce + AES-GCM ciphertext under salt's key, counted towards its rotation limit.
+        A given nonce must be fresh and random (e.g. a token chosen ahead); never reuse one."""
+        with self._lock:
+            aead = self._aead(salt)
+            self._uses[salt] = self._uses.get(salt, 0) + 1
+        nonce = nonce or os.urandom(NONCE_SIZE)
+        return nonce + aead.encrypt(nonce, plaintext, aad)
+
+    def exhausted(self, salt: bytes) -> bool:
+        """True once salt's key reached the limit; its data should be re-encrypted under a new salt."""
+        with self._lock:
+            return self._uses.get(salt, 0) >= self._max_encryptions
+
+    def encrypt(self, plaintext: bytes, nonce: Optional[bytes] = None) -> bytes:
+        salt = self.salt
+        return MAGIC + salt + self.seal(salt, plaintext, None, nonce)
+
+    def decrypt(self, blob: bytes) -> bytes:
+        salt, nonce, ct = _split(blob)
+        with self._lock:
+            aead = self._aead(salt)
+        pt = aead.decrypt(nonce, ct, None)
+        with self._lock:
+            if self._salt is None:
+                self._salt = salt
+        return pt
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._salt = None
+            self._uses.clear()
+            for i in range(len(self._password)):
+                self._password[i] = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.clear()
 
 
 def hash_password_hex(password: str) -> str:
@@ -0,0 +1,240 @@
+"""
+index.py - 内存索引：按 id 查找交易、账户、分类，以及按时间排序的交易索引（由 Ledger 在增删改时维护）
+"""
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Dict, Tuple
+from .models import Transaction, Account, Category, TxType
+
+
+# batches larger than this are merged into the date index instead of inserted row by row
+BULK_MERGE_MIN = 256
+
+
+class LedgerIndex:
+    def __init__(self, txs: List[Transaction], accounts: List[Account], categories: List[Category]):
+        self.txs = txs
+        self.accounts = accounts
+        self.categories = categories
+        self.tx_pos: Dict[str, int] = {}
+        self.accounts_by_id: Dict[str, Account] = {}
+        self.categories_by_id: Dict[str, Category] = {}
+        # reverse name maps (first occurrence wins), rebuilt when the lists grow behind our back
+        self.accounts_by_name: Dict[str, Account] = {}
+        self.categories_by_name: Dict[Tuple[str, Optional[TxType]], Category] = {}
+        self._names_len = (-1, -1)
+        # date index: three parallel lists ordered by (datetime, id)
+        self._dts: List[str] = []
+        self._ids: List[str] = []
+        self._by_date: List[Transaction] = []
+        self.rebuild()
+
+    def rebuild(self):
+        self.rebuild_positions()
+        self.rebuild_dates()
+        self.accounts_by_id = {a.id: a for a in self.accounts}
+        self.categories_by_id = {c.id: c for c in self.categories}
+        self._names_len = (-1, -1)
+
+    def rebuild_positions(self):
+        # first occurrence wins, same as the old linear scans
+        pos = {}
+        for i, t in enumerate(self.txs):
+            pos.setdefault(t.id, i)
+        self.tx_pos = pos
+
+    def rebuild_dates(self):
+        ordered = sorted(self.txs, key=lambda t: (t.datetime, t.id))
+        self._dts = [t.datetime for t in ordered]
+        self._ids = [t.id for t in ordered]
+        self._by_date = ordered
+
+    # --- transactions ---
+
+    def position(self, tx_id: str) -> Optional[int]:
+        i = self.tx_pos.get(tx_id)
+        if i is not None and (i >= len(self.txs) or self.txs[i].id != tx_id):
+            # list was changed behind our back
+            self.rebuild_positions()
+            i = self.tx_pos.get(tx_id)
+        return i
+
+    def get_transaction(self, tx_id: str) -> Optional[Transaction]:
+        i = self.position(tx_id)
+        return None if i is None else self.txs[i]
+
+    def has_transaction(self, tx_id: str) -> bool:
+        return tx_id in self.tx_pos
+
+    def on_append(self, tx: Transaction, dates: bool = True):
+        # call after self.txs.append(tx); dates=False leaves the date index to add_dates()
+        self.tx_pos.setdefault(tx.id, len(self.txs) - 1)
+        if dates:
+            self._date_insert(tx)
+
+    def add_dates(self, txs: List[Transaction]):
+        """Date-index a batch appended with on_append(dates=False)."""
+        if len(txs) <= BULK_MERGE_MIN:
+            for t in txs:
+                self._date_insert(t)
+            return
+        # one merge instead of a list insert (O(n) each) per row: only the batch is sorted,
+        # its positions in the existing lists are found by bisection and the runs between
+        # them copied as slices; equal keys keep existing rows first like _date_insert
+        dts, ids, by_date = self._dts, self._ids, self._by_date
+        new_dts: List[str] = []
+        new_ids: List[str] = []
+        new_by: List[Transaction] = []
+        prev = 0
+        for t in sorted(txs, key=lambda t: (t.datetime, t.id)):
+            lo = bisect_left(dts, t.datetime, prev)
+            hi = bisect_right(dts, t.datetime, lo)
+            k = bisect_right(ids, t.id, lo, hi)
+            if k > prev:
+                new_dts += dts[prev:k]
+                new_ids += ids[prev:k]
+                new_by += by_date[prev:k]
+                prev = k
+            new_dts.append(t.datetime)
+            new_ids.append(t.id)
+            new_by.append(t)
+        new_dts += dts[prev:]
+        new_ids += ids[prev:]
+        new_by += by_date[prev:]
+        self._dts, self._ids, self._by_date = new_dts, new_ids, new_by
+
+    def on_replace(self, i: int, old: Transaction, new: Transaction):
+        # call after self.txs[i] = new
+        if old.id != new.id:
+            self.rebuild_positions()
+        self._date_remove(old)
+        self._date_insert(new)
+
+    def on_delete(self, i: int, old: Transaction):
+        # call after del self.txs[i]; shift the positions of everything behind i
+        pos = self.tx_pos
+        if pos.get(old.id) == i:
+            del pos[old.id]
+        for j in range(i, len(self.txs)):
+            tid = self.txs[j].id
+            cur = pos.get(tid)
+            if cur is None or cur > j:
+                pos[tid] = j
+        self._date_remove(old)
+
+    # --- date index ---
+
+    def _date_insert(self, tx: Transaction):
+        dts = self._dts
+        lo = bisect_left(dts, tx.datetime)
+        hi = bisect_right(dts, tx.datetime, lo)
+        k = bisect_right(self._ids, tx.id, lo, hi)
+        dts.insert(k, tx.datetime)
+        self._ids.insert(k, tx.id)
+        self._by_date.insert(k, tx)
+
+    def _date_remove(self, tx: Transaction):
+        lo = bisect_left(self._dts, tx.datetime)
+        hi = bisect_right(self._dts, tx.datetime, lo)
+        k = bisect_left(self._ids, tx.id, lo, hi)
+        while k < hi and self._ids[k] == tx.id and self._by_date[k] is not tx:
+            k += 1
+        if k >= hi or self._by_date[k] is not tx:
+            # key fields were mutated in place since insertion; fall back to an identity scan
+            k = next((j for j, t in enumerate(self._by_date) if t is tx), None)
+            if k is None:
+                return
+        del self._dts[k]
+        del self._ids[k]
+        del self._by_date[k]
+
+    def date_bounds(self, start_iso: str = "", end_iso: str = "") -> Tuple[int, int]:
+        """Slice [i, j) of the date order with start_iso <= datetime <= end_iso (empty = unbounded)."""
+        i = bisect_left(self._dts, start_iso) if start_iso else 0
+        j = bisect_right(self._dts, end_iso) if end_iso else len(self._dts)
+        return i, max(i, j)
+
+    def date_position(self, key: str) -> int:
+        return bisect_left(self._dts, key)
+
+    def key_position(self, dt: str, tx_id: str, after: bool = True) -> int:
+        """First position whose (datetime, id) is > (dt, tx_id), or >= when after is False."""
+        lo = bisect_left(self._dts, dt)
+        hi = bisect_right(self._dts, dt, lo)
+        if after:
+            return bisect_right(self._ids, tx_id, lo, hi)
+        return bisect_left(self._ids, tx_id, lo, hi)
+
+    def date_slice(self, i: int, j: int) -> List[Transaction]:
+        return self._by_date[i:j]
+
+    def date_range(self, start_iso: str = "", end_iso: str = "") -> List[Transaction]:
+        """Transactions in [start_iso, end_iso] ordered by (datetime, id); O(log n + k)."""
+        i, j = self.date_bounds(start_iso, end_iso)
+        return self._by_date[i:j]
+
+    # --- accounts / categories ---
+
+    def account(self, account_id: str) -> Optional[Account]:
+        a = self.accounts_by_id.get(account_id)
+        if a is None and len(self.accounts_by_id) != len(self.accounts):
+            # accounts were appended outside the service (e.g. CLI menu 10)
+            self.accounts_by_id = {x.id: x for x in self.accounts}
+            a = self.accounts_by_id.get(account_id)
+        return a
+
+    def category(self, category_id: str) -> Optional[Category]:
+        c = self.categories_by_id.get(category_id)
+        if c is None and len(self.categories_by_id) != len(self.categories):
+            self.categories_by_id = {x.id: x for x in self.categories}
+            c = self.categories_by_id.get(category_id)
+        return c
+
+    def _refresh_names(self):
+        if self._names_len == (len(self.accounts), len(self.categories)):
+            return
+        self.accounts_by_name = {}
+        for a in self.accounts:
+            self.accounts_by_name.setdefault(a.name, a)
+        self.categories_by_name = {}
+        for c in self.categories:
+            self._name_category(c)
+        self._names_len = (len(self.accounts), len(self.categories))
+
+    def _name_category(self, c: Category):
+        # by (name, type), and by (name, None) for lookups that do not know the type
+        self.categories_by_name.setdefault((c.name, c.type), c)
+        self.categories_by_name.setdefault((c.name, None), c)
+
+    def account_by_name(self, name: str) -> Optional[Account]:
+        self._refresh_names()
+        return self.accounts_by_name.get(name)
+
+    def category_by_name(self, name: str, tx_type: Optional[TxType] = None) -> Optional[Category]:
+        """Prefers a category of tx_type, falls back to any category with that name."""
+        self._refresh_names()
+        c = self.categories_by_name.get((name, tx_type))
+        if c is None and tx_type is not None:
+            c = self.categories_by_name.get((name, None))
+        return c
+
+    def add_account(self, a: Account):
+        self._refresh_names()
+        self.accounts.append(a)
+        self.accounts_by_id[a.id] = a
+        self.accounts_by_name.setdefault(a.name, a)
+        self._names_len = (len(self.accounts), self._names_len[1])
+
+    def add_category(self, c: Category):
+        self._refresh_names()
+        self.categories.append(c)
+        self.categories_by_id[c.id] = c
+        self._name_category(c)
+        self._names_len = (self._names_len[0], len(self.categories))
+
+    def account_name(self, account_id: str) -> str:
+        a = self.account(account_id)
+        return a.name if a else account_id
+
+    def category_name(self, category_id: str) -> str:
+        c = self.category(category_id)
+        return c.name if c else category_id
@@ -0,0 +1,296 @@
+"""
+journal.py - 预写日志 (WAL)：每次交易变更加密追加到 <数据文件>.wal，加载时在最近一次保存的数据之上重放
+File format (binary):
+  4 bytes magic: b'FAJ1', u16 version, u16 reserved
+  16 bytes salt, 12 bytes checkpoint token (identifies the data file state the journal applies to)
+  records, repeated: u32 body length, u32 seq, body = 12 bytes nonce + AES-GCM ciphertext
+    AAD = header + seq; plaintext = u32 + JSON of the accounts/categories created since the
+    checkpoint (empty if none), then change ops encoded like a segment (segments.encode_ops);
+    version 2 records hold the ops only
+Replay stops at the first record that is incomplete or fails to authenticate (a torn
+tail). A journal whose token does not match the data file is stale (the data file was
+checkpointed after it) and is discarded.
+Group commit: ops are buffered and written as one record per commit(); fsync happens at
+most every fsync_interval seconds (0 = on every commit), sync() forces it.
+While a checkpoint is being written in the background, ops also go to <数据文件>.wal.next,
+whose header carries the new checkpoint's token (chosen before the write). Recovery uses
+whichever of the two journals matches the data file on disk.
+"""
+import json
+import os
+import struct
+import time
+from typing import List, Optional, Tuple, Union
+from .models import Transaction, Account, Category
+from . import binfmt, encryption, segments, utils
+
+# one commit: segments.decode_ops() output plus the accounts and categories it created
+Batch = Tuple[bytes, List[str], List[Transaction], List[Account], List[Category]]
+Entity = Union[Account, Category]
+
+MAGIC = b"FAJ1"
+# 2: segment ops with int64 cents; 3: records also carry created accounts/categories.
+# Older journals are rewritten on recovery.
+VERSION = 3
+TOKEN_SIZE = 12
+NEXT_SUFFIX = ".next"  # journal of the checkpoint being written, see begin()
+
+_HEADER = struct.Struct("<4sHH")
+_RECORD = struct.Struct("<II")
+_HEADER_SIZE = _HEADER.size + encryption.SALT_SIZE + TOKEN_SIZE
+
+
+class Journal:
+    def __init__(self, path: str, keys: encryption.KeySession, fsync_interval: float = 0.0):
+        self.path = path
+        self.keys = keys
+        self.fsync_interval = fsync_interval
+        self.token: Optional[bytes] = None  # None until recover()/reset(): journaling disabled
+        self.salt = b""
+        self.version = VERSION  # of the file on disk; part of every record's AAD
+        self.seq = 0
+        self.pending: List[segments.Change] = []
+        self.entities: List[Entity] = []  # accounts/categories for the next commit
+        self.next: Optional["Journal"] = None  # set between begin() and promote()
+        self._file = None
+        self._last_fsync = 0.0
+        self._unsynced = False
+
+    @property
+    def ready(self) -> bool:
+        return self.token is not None
+
+    def _header(self) -> bytes:
+        return _HEADER.pack(MAGIC, self.version, 0) + self.salt + self.token
+
+    def _aad(self, seq: int) -> bytes:
+        return self._header() + struct.pack("<I", seq)
+
+    # --- recovery ---
+
+    def recover(self, token: bytes) -> List[Batch]:
+        """Batches journaled on top of the checkpoint identified by token; positions the
+        journal to keep appending after them."""
+        self.close()
+        self.next = None
+        self.token = token
+        self.seq = 0
+        next_path = self.path + NEXT_SUFFIX
+        if utils.file_exists(next_path):
+            if _file_token(next_path) == token:
+                # the background checkpoint reached the disk but was not finished
+                os.replace(next_path, self.path)
+            else:
+                os.remove(next_path)
+        if not utils.file_exists(self.path):
+            return []
+        data = utils.read_bytes(self.path)
+        magic, version, _ = _HEADER.unpack_from(data, 0) if len(data) >= _HEADER_SIZE else (b"", 0, 0)
+        file_token = data[_HEADER.size + encryption.SALT_SIZE:_HEADER_SIZE]
+        if magic != MAGIC or version > VERSION or file_token != token:
+            self._discard()
+            return []
+        self.salt = data[_HEADER.size:_HEADER.size + encryption.SALT_SIZE]
+        self.version = version
+        batches: List[Batch] = []
+        pos = _HEADER_SIZE
+        aead = self.keys.aead(self.salt)
+        while pos + _RECORD.size <= len(data):
+            length, seq = _RECORD.unpack_from(data, pos)
+            body = data[pos + _RECORD.size:pos + _RECORD.size + length]
+            if len(body) < length or seq != self.seq:
+                break
+            nonce, ct = body[:encryption.NONCE_SIZE], body[encryption.NONCE_SIZE:]
+            try:
+                payload = aead.decrypt(nonce, ct, self._aad(seq))
+            except Exception:
+                break
+            batches.append(decode_batch(payload, version))
+            self.seq += 1
+            pos += _RECORD.size + length
+        if version < VERSION:
+            self._rewrite(batches)
+            return batches
+        # drop the torn tail, keep appending after the last good record
+        self._file = open(self.path, "r+b")
+        self._file.seek(pos)
+        self._file.truncate()
+        return batches
+
+    def _rewrite(self, batches: List[Batch]):
+        # appending needs the current encoding: re-encode the journal in one atomic replace
+        self.version = VERSION
+        self.salt = self.keys.salt
+        self.seq = 0
+        parts = [self._header()]
+        for batch in batches:
+            parts.append(self._record(encode_batch(segments.batch_changes(*batch[:3]), batch[3] + batch[4])))
+        utils.atomic_write_bytes(self.path, b"".join(parts))
+        self._file = open(self.path, "r+b")
+        self._file.seek(0, os.SEEK_END)
+
+    def _discard(self):
+        if utils.file_exists(self.path):
+            os.remove(self.path)
+
+    def reset(self, token: bytes):
+        """Called after a checkpoint: everything journaled so far is in the data file."""
+        self.abort()
+        self.close()
+        self.pending = []
+        self.entities = []
+        self.token = token
+        self.seq = 0
+        self._discard()
+
+    # --- background checkpoints ---
+
+    def begin(self, token: bytes):
+        """A checkpoint identified by token is about to be written from a snapshot taken
+        now: later ops go to this journal and to one against token, so a crash keeps them
+        whether or not the checkpoint reaches the disk."""
+        if self.token is None:
+            return
+        self.abort()
+        self.next = Journal(self.path + NEXT_SUFFIX, self.keys, self.fsync_interval)
+        self.next.reset(token)
+
+    def promote(self):
+        """The checkpoint from begin() is on disk: continue in its journal."""
+        nxt, self.next = self.next, None
+        if nxt is None:
+            return
+        nxt.close()
+        self.close()
+        if utils.file_exists(nxt.path):
+            os.replace(nxt.path, self.path)
+        else:
+            self._discard()
+        self.pending = []
+        self.entities = []
+        self.token, self.salt, self.version, self.seq = nxt.token, nxt.salt, nxt.version, nxt.seq
+        if utils.file_exists(self.path):
+            self._file = open(self.path, "r+b")
+            self._file.seek(0, os.SEEK_END)
+
+    def abort(self):
+        """Drop the journal from begin(); this one still holds every op."""
+        nxt, self.next = self.next, None
+        if nxt is not None:
+            nxt.close()
+            nxt._discard()
+
+    # --- append ---
+
+    def append(self, change: segments.Change):
+        if self.token is not None:
+            self.pending.append(change)
+        if self.next is not None:
+            self.next.append(change)
+
+    def append_entity(self, entity: Entity):
+        """An account or category created since the checkpoint, so journaled transactions
+        never refer to one the data file lacks."""
+        if self.token is not None:
+            self.entities.append(entity)
+        if self.next is not None:
+            self.next.append_entity(entity)
+
+    def _open_for_append(self):
+        if self._file is None:
+            self.salt = self.keys.salt
+            self.version = VERSION
+            utils.atomic_write_bytes(self.path, self._header())
+            self._file = open(self.path, "r+b")
+            self._file.seek(0, os.SEEK_END)
+
+    def _record(self, payload: bytes) -> bytes:
+        body = self.keys.seal(self.salt, payload, self._aad(self.seq))
+        self.seq += 1
+        return _RECORD.pack(len(body), self.seq - 1) + body
+
+    def commit(self):
+        """Write pending ops as one record (group commit)."""
+        if self.next is not None:
+            self.next.commit()
+        if not (self.pending or self.entities) or self.token is None:
+            return
+        # taken before encoding: a batch that cannot be encoded is dropped, not retried by
+        # every later commit
+        changes, entities = self.pending, self.entities
+        self.pending, self.entities = [], []
+        payload = encode_batch(changes, entities)
+        self._open_for_append()
+        self._file.write(self._record(payload))
+        self._file.flush()
+        self._unsynced = True
+        if time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.next is not None:
+            self.next.sync()
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+            self._unsynced = False
+
+    def close(self):
+        # a pending next journal stays on disk for recovery
+        if self.next is not None:
+            self.next.close()
+        if self._file is not None:
+            self.commit()
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+def _file_token(path: str) -> Optional[bytes]:
+    with open(path, "rb") as f:
+        head = f.read(_HEADER_SIZE)
+    if len(head) < _HEADER_SIZE or head[:len(MAGIC)] != MAGIC:
+        return None
+    return head[_HEADER.size + encryption.SALT_SIZE:]
+
+
+def encode_batch(changes: List[segments.Change], entities: List[Entity]) -> bytes:
+    w = binfmt.Writer()
+    meta = b""
+    if entities:
+        meta = json.dumps({
+            "accounts": [e.to_dict() for e in entities if isinstance(e, Account)],
+            "categories": [e.to_dict() for e in entities if isinstance(e, Category)],
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    w.blob(meta)
+    w.parts.append(segments.encode_ops(changes))
+    return w.getvalue()
+
+
+def decode_batch(payload: bytes, version: int = VERSION) -> Batch:
+    if version < 3:
+        return segments.decode_ops(payload, binfmt.VERSION if version >= 2 else 1) + ([], [])
+    r = binfmt.Reader(payload)
+    meta = r.blob()
+    d = json.loads(meta.decode("utf-8")) if meta else {}
+    accts = [Account.from_dict(a) for a in d.get("accounts", [])]
+    cats = [Category.from_dict(c) for c in d.get("categories", [])]
+    return segments.decode_ops(payload[r.pos:]) + (accts, cats)
+
+
+def replay(txs: List[Transaction], batches: List[Batch]) -> List[Transaction]:
+    r = segments.Replay()
+    r.slots.extend(txs)
+    for batch in batches:
+        r.apply_segment(*batch[:3])
+    return r.result()
+
+
+def replay_entities(accts: List[Account], cats: List[Category], batches: List[Batch]):
+    """Append the journaled accounts and categories the checkpoint does not have yet."""
+    have = {a.id for a in accts} | {c.id for c in cats}
+    for batch in batches:
+        for e in batch[3] + batch[4]:
+            if e.id not in have:
+                have.add(e.id)
+                (accts if isinstance(e, Account) else cats).append(e)
@@ -0,0 +1,120 @@
+"""
+ledger.py - 共享账本：交易、账户、分类列表只在这里原地修改，同时维护索引与账户余额；
+每次变更递增版本号并通知订阅者（汇总、列式视图、搜索索引等），TransactionService 与 StatisticsService 共用同一个实例。
+"""
+from typing import List, Optional, Dict
+from .models import Transaction, Account, Category, TxType
+from .index import LedgerIndex
+from . import money
+
+
+class Ledger:
+    """
+    Subscribers (views) implement add(tx), remove(tx) and rebuild(): add/remove follow
+    every change incrementally, rebuild is only called after a transaction was edited in
+    place. Readers that cache results compare version instead of subscribing.
+    Mutations are not locked here; TransactionService.lock serializes them.
+    """
+
+    def __init__(self, txs: Optional[List[Transaction]] = None, accounts: Optional[List[Account]] = None,
+                 categories: Optional[List[Category]] = None):
+        self.txs = txs if txs is not None else []
+        self.accounts = accounts if accounts is not None else []
+        self.categories = categories if categories is not None else []
+        self.index = LedgerIndex(self.txs, self.accounts, self.categories)
+        self.version = 0  # bumped by every mutation
+        self._views: List = []
+
+    def subscribe(self, view):
+        """Keep view in sync from now on; it must already reflect the current txs. Returns view."""
+        self._views.append(view)
+        return view
+
+    def unsubscribe(self, view):
+        if view in self._views:
+            self._views.remove(view)
+
+    # --- mutations ---
+
+    def append(self, tx: Transaction, dates: bool = True):
+        # dates=False: the caller date-indexes the batch with add_dates() afterwards
+        self.txs.append(tx)
+        self.index.on_append(tx, dates)
+        self._added(tx)
+
+    def add_dates(self, txs: List[Transaction]):
+        self.index.add_dates(txs)
+
+    def replace(self, i: int, new_tx: Transaction):
+        t = self.txs[i]
+        if new_tx is t:
+            # edited in place: the previous amount/account is gone, repair from scratch
+            self.index.on_replace(i, t, new_tx)
+            self.rebuild()
+            return
+        self._removed(t)
+        self.txs[i] = new_tx
+        self.index.on_replace(i, t, new_tx)
+        self._added(new_tx)
+
+    def delete(self, i: int) -> Transaction:
+        t = self.txs[i]
+        del self.txs[i]
+        self.index.on_delete(i, t)
+        self._removed(t)
+        return t
+
+    def add_account(self, a: Account):
+        self.index.add_account(a)
+        self.version += 1
+
+    def add_category(self, c: Category):
+        self.index.add_category(c)
+        self.version += 1
+
+    def rebuild(self):
+        """Recompute balances and every subscribed view from the lists."""
+        for view in self._views:
+            view.rebuild()
+        self.recalculate_balances()
+        self.version += 1
+
+    def _added(self, tx: Transaction):
+        self._apply_balance(tx, 1)
+        for view in self._views:
+            view.add(tx)
+        self.version += 1
+
+    def _removed(self, tx: Transaction):
+        self._apply_balance(tx, -1)
+        for view in self._views:
+            view.remove(tx)
+        self.version += 1
+
+    # --- balances ---
+
+    def _apply_balance(self, tx: Transaction, sign: int):
+        a = self.index.account(tx.account_id)
+        if a is None:
+            return
+        if tx.type == TxType.Income:
+            a.current_balance += sign * tx.amount
+        else:
+            a.current_balance -= sign * tx.amount
+
+    def expected_balances(self) -> Dict[str, money.Cents]:
+        """Replay every transaction from initial_balance; O(n + m), does not modify accounts."""
+        out = {a.id: a.initial_balance for a in self.accounts}
+        for t in self.txs:
+            if t.account_id not in out:
+                continue
+            if t.type == TxType.Income:
+                out[t.account_id] += t.amount
+            else:
+                out[t.account_id] -= t.amount
+        return out
+
+    def recalculate_balances(self):
+        expected = self.expected_balances()
+        for a in self.accounts:
+            a.current_balance = expected[a.id]
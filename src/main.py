@@ -4,13 +4,21 @@ main.py - CLI 入口，提供菜单用于交互（添加/编辑/删除交易、
 """
 import sys
 import os
+import copy
 from .models import Transaction, Account, Category, AppLock, TxType
-from .storage import LocalStorage
-from .services import TransactionService, StatisticsService, ExportService
-from . import utils, encryption
+from .storage import open_storage, LazyTransactions, FORMAT_SEGMENTED
+from .ledger import Ledger
+from .services import TransactionService, StatisticsService, ExportService, NameResolver
+from .reports import ReportEngine
+from .autosave import AutoSaver
+from . import utils, encryption, money, checkpoints
 import traceback
 
-DATA_FILE = "data.enc"
+# a *.db / *.sqlite path selects the SQLite backend
+DATA_FILE = os.environ.get("FINANCEAPP_DATA", "data.enc")
+PAGE_SIZE = 20
+# menu options that may change data and so schedule an autosave
+MUTATING_CHOICES = ("1", "2", "3", "7", "10", "11", "12")
 
 
 def input_nonempty(prompt: str) -> str:
@@ -32,24 +40,103 @@ def print_main_menu():
     print("10) 管理账户")
     print("11) 管理分类")
     print("12) 应用锁设置")
+    print("13) 搜索交易（备注/金额/账户/分类）")
+    print("14) 导出报表（按日/周/月汇总、账户余额走势）")
+    print("15) 查询账户历史余额")
     print("0) 退出并保存")
     print("请选择: ", end="", flush=True)
 
 
+def print_pages(fetch, page_size: int = PAGE_SIZE):
+    """fetch(limit, cursor) -> (rows, next cursor); prints one page at a time."""
+    cursor = None
+    while True:
+        rows, cursor = fetch(page_size, cursor)
+        for t in rows:
+            print(f"{t.id} | {t.type.value} | {money.format_cents(t.amount)} | {t.datetime} | {t.remark}")
+        if cursor is None:
+            return
+        if input("回车显示下一页，q 返回菜单: ").strip().lower() == "q":
+            return
+
+
+def list_pages(rows):
+    # fetch for print_pages over an in-memory list; the cursor is an offset
+    def fetch(n, cur):
+        start = cur or 0
+        return rows[start:start + n], (start + n if start + n < len(rows) else None)
+    return fetch
+
+
+def print_import_report(r: dict):
+    print(f"{r['path']}: {r['rows']} 行, 导入 {r['added']}, 跳过 {r['skipped']}, 错误 {r['error_count']}"
+          f" ({r['rows_per_sec']:.0f} 行/秒)")
+    for e in r["errors"]:
+        print("  ", e)
+
+
+def make_progress(label: str):
+    # prints rows processed and throughput on a single terminal line
+    import time
+    start = time.perf_counter()
+
+    def report(rows: int):
+        elapsed = time.perf_counter() - start
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        print(f"\r{label}: {rows} 行 ({rate:.0f} 行/秒)", end="", flush=True)
+    return report
+
+
 def main():
     print("FinanceApp (Python 实现)")
 
     pwd = input("请输入应用密码（若空则使用空密码）：").strip()
-    storage = LocalStorage(DATA_FILE, pwd)
+    # older single-blob data files are read transparently and rewritten as segments on save;
+    # after that each save only appends what changed
+    storage = open_storage(DATA_FILE, pwd, FORMAT_SEGMENTED)
     try:
-        txs, accounts, categories, applock = storage.load()
+        # only accounts, categories and applock are read here; transactions are
+        # decrypted when a menu first needs them
+        lazy, accounts, categories, applock = storage.open_lazy()
     except Exception as e:
         print("加载数据失败:", e)
         # If decrypt failed, ask user whether to continue with empty dataset or exit
         ans = input("是否以空数据继续？(y/N): ").strip().lower()
         if ans != "y":
             return
-        txs, accounts, categories, applock = [], [], [], AppLock()
+        lazy, accounts, categories, applock = LazyTransactions(list), [], [], AppLock()
+
+    tx_service = None
+    stat_service = None
+    autosaver = None
+    # accounts/categories created before the services exist; journaled once they do
+    early_entities = []
+
+    def ensure_services():
+        nonlocal tx_service, stat_service, autosaver
+        if tx_service is not None:
+            return
+        txs = lazy.materialize()
+        # every mutation is journaled, so a crash loses nothing since the last save
+        ledger = Ledger(txs, accounts, categories)
+        tx_service = TransactionService(ledger, journal=storage.journal if storage.journal.ready else None,
+                                        trust_balances=lazy.balances_current,
+                                        checkpoints=storage.load_extra(checkpoints.EXTRA_NAME))
+        tx_service.journal_entities(early_entities)
+        early_entities.clear()
+        stat_service = StatisticsService(ledger, tx_service.rollups, sql=storage if storage.pushdown else None)
+        # saves a few seconds after each change, off the input loop
+        autosaver = AutoSaver(storage, tx_service, applock)
+
+    def save_all():
+        if autosaver is not None:
+            autosaver.flush()
+            return
+        if tx_service is None and storage.save_meta(accounts, categories, applock):
+            return
+        ensure_services()
+        storage.save(tx_service.txs, accounts, categories, applock, tx_service.take_changes())
+        storage.save_extra(checkpoints.EXTRA_NAME, tx_service.checkpoints.to_dict())
 
     # Check applock
     if applock.enabled:
@@ -75,38 +162,39 @@ def main():
                     break
         if not ok and applock.lock_until > int(time.time()):
             # save lock state and exit
-            storage.save(txs, accounts, categories, applock)
+            save_all()
             return
 
     # ensure default account / category if empty
     if not accounts:
-        a = Account(id=utils.generate_uuid(), name="现金", initial_balance=0.0, current_balance=0.0)
+        a = Account(id=utils.generate_uuid(), name="现金", initial_balance=0, current_balance=0)
         accounts.append(a)
+        early_entities.append(a)
     if not categories:
         c1 = Category(id=utils.generate_uuid(), name="餐饮", type=TxType.Expense, color="#FF0000")
         c2 = Category(id=utils.generate_uuid(), name="工资", type=TxType.Income, color="#00AA00")
         categories.extend([c1, c2])
-
-    tx_service = TransactionService(txs, accounts, categories)
-    stat_service = StatisticsService(txs, categories)
+        early_entities.extend([c1, c2])
 
     running = True
     while running:
         try:
             print_main_menu()
             choice = input().strip()
+            if choice in ("1", "2", "3", "4", "6", "7", "13", "14", "15") or (choice == "9" and not storage.pushdown):
+                ensure_services()
             if choice == "1":
                 # add transaction
                 typ = input("类型 (0:收入 1:支出): ").strip()
                 ttype = TxType.Income if typ == "0" else TxType.Expense
-                amt = float(input("金额: ").strip())
+                amt = money.parse(input("金额: "))
                 print("可用分类:")
                 for c in categories:
                     print(f"{c.id} : {c.name} ({c.type.value})")
                 cid = input("输入分类ID: ").strip()
                 print("可用账户:")
                 for a in accounts:
-                    print(f"{a.id} : {a.name} (余额 {a.current_balance})")
+                    print(f"{a.id} : {a.name} (余额 {money.format_cents(a.current_balance)})")
                 aid = input("输入账户ID: ").strip()
                 dt = input("时间 (空用当前 YYYY-MM-DDTHH:MM:SS): ").strip()
                 if not dt:
@@ -129,10 +217,12 @@ def main():
                 if not t:
                     print("未找到交易")
                     continue
-                print("当前金额:", t.amount)
+                # edit a copy so the service can reverse the old amount incrementally
+                t = copy.copy(t)
+                print("当前金额:", money.format_cents(t.amount))
                 s = input("新金额(回车保留): ").strip()
                 if s:
-                    t.amount = float(s)
+                    t.amount = money.parse(s)
                 s = input(f"当前备注: {t.remark} 新备注回车保留: ").strip()
                 if s:
                     t.remark = s
@@ -145,27 +235,45 @@ def main():
                 else:
                     print("未找到")
             elif choice == "4":
-                alltx = tx_service.list_transactions()
-                print(f"共 {len(alltx)} 条交易：")
-                for t in alltx:
-                    print(f"{t.id} | {t.type.value} | {t.amount} | {t.datetime} | {t.remark}")
+                print(f"共 {len(tx_service.txs)} 条交易（按时间排序）：")
+                print_pages(lambda n, cur: tx_service.page(n, cur))
             elif choice == "5":
                 st = input("开始时间 (空不限制): ").strip()
                 ed = input("结束时间 (空不限制): ").strip()
-                res = tx_service.filter_by_date_range(st, ed)
-                print(f"筛选结果 {len(res)} 条：")
-                for t in res:
-                    print(f"{t.id} | {t.type.value} | {t.amount} | {t.datetime} | {t.remark}")
+                if tx_service is None:
+                    # before anything is loaded only the segments covering the range are read
+                    res = lazy.range(st, ed)
+                    print(f"筛选结果 {len(res)} 条：")
+                    print_pages(list_pages(res))
+                else:
+                    i, j = tx_service.index.date_bounds(st, ed)
+                    print(f"筛选结果 {j - i} 条：")
+                    print_pages(lambda n, cur: tx_service.page(n, cur, st, ed))
             elif choice == "6":
                 path = input("导出 CSV 路径 (例如 export.csv): ").strip()
-                ok = ExportService.export_transactions_to_csv(txs, categories, accounts, path)
+                ok = ExportService.export_transactions_to_csv(tx_service.txs, categories, accounts, path,
+                                                              progress=make_progress("已导出"),
+                                                              index=tx_service.index)
+                print()
                 print("导出成功" if ok else "导出失败")
             elif choice == "7":
-                path = input("导入 CSV 路径: ").strip()
-                imported = ExportService.import_transactions_from_csv(path)
-                for t in imported:
-                    tx_service.add_transaction(t)
-                print(f"已导入 {len(imported)} 条")
+                paths = [p.strip() for p in input("导入 CSV 路径（多个文件用 ; 分隔）: ").split(";") if p.strip()]
+                create = input("自动创建不存在的分类/账户？(y/N): ").strip().lower() == "y"
+                resolver = NameResolver(tx_service, auto_create=create)
+                if len(paths) == 1:
+                    report = ExportService.import_csv_into(tx_service, paths[0], progress=make_progress("已读取"),
+                                                           resolver=resolver)
+                    print()
+                    print_import_report(report)
+                else:
+                    # files are parsed in parallel and merged in the order given
+                    reports = ExportService.import_files_into(tx_service, paths, progress=print_import_report,
+                                                              resolver=resolver)
+                    print(f"共导入 {sum(r['added'] for r in reports)} 条")
+                if resolver.created_accounts or resolver.created_categories:
+                    print(f"新建账户 {len(resolver.created_accounts)} 个，分类 {len(resolver.created_categories)} 个")
+                if resolver.unresolved:
+                    print(f"{resolver.unresolved} 个分类/账户名称未找到，已按原值保存")
             elif choice == "8":
                 import time
                 t = int(time.time())
@@ -177,23 +285,31 @@ def main():
             elif choice == "9":
                 st = input("开始时间 (空不限制): ").strip()
                 ed = input("结束时间 (空不限制): ").strip()
-                inc, ex = stat_service.calculate_totals(st, ed)
-                print(f"收入合计: {inc} 支出合计: {ex}")
-                top = stat_service.top_categories(TxType.Expense, 10, st, ed)
+                stats = stat_service
+                if stats is None:
+                    # SQLite answers from the database without loading the transactions
+                    stats = StatisticsService(Ledger([], accounts, categories), sql=storage)
+                inc, ex = stats.calculate_totals(st, ed)
+                print(f"收入合计: {money.format_cents(inc)} 支出合计: {money.format_cents(ex)}")
+                top = stats.top_categories(TxType.Expense, 10, st, ed)
                 print("支出排行：")
                 for s in top:
-                    print(f"{s['category_name']} : {s['total']}")
+                    print(f"{s['category_name']} : {money.format_cents(s['total'])}")
             elif choice == "10":
                 op = input("账户: 1) 新增 2) 列表 请选择: ").strip()
                 if op == "1":
                     name = input("名称: ").strip()
-                    bal = float(input("初始余额: ").strip() or "0")
+                    bal = money.parse(input("初始余额: ").strip() or "0")
                     a = Account(id=utils.generate_uuid(), name=name, initial_balance=bal, current_balance=bal)
-                    accounts.append(a)
+                    if tx_service is not None:
+                        tx_service.add_account(a)
+                    else:
+                        accounts.append(a)
+                        early_entities.append(a)
                     print("已添加账户", a.id)
                 else:
                     for a in accounts:
-                        print(f"{a.id} | {a.name} | 初始 {a.initial_balance} | 当前 {a.current_balance}")
+                        print(f"{a.id} | {a.name} | 初始 {money.format_cents(a.initial_balance)} | 当前 {money.format_cents(a.current_balance)}")
             elif choice == "11":
                 op = input("分类: 1) 新增 2) 列表 请选择: ").strip()
                 if op == "1":
@@ -202,7 +318,12 @@ def main():
                     ctype = TxType.Income if tp == "0" else TxType.Expense
                     color = input("颜色(例如 #FF0000): ").strip() or "#000000"
                     c = Category(id=utils.generate_uuid(), name=name, type=ctype, color=color)
-                    categories.append(c)
+                    if tx_service is not None:
+                        # through the service so cached statistics see the new name
+                        tx_service.add_category(c)
+                    else:
+                        categories.append(c)
+                        early_entities.append(c)
                     print("已添加分类", c.id)
                 else:
                     for c in categories:
@@ -222,9 +343,38 @@ def main():
                     applock.wrong_attempts = 0
                     applock.lock_until = 0
                     print("已关闭应用锁")
+            elif choice == "13":
+                text = input("备注关键词 (空不限制): ").strip()
+                aid = input("账户ID (空不限制): ").strip() or None
+                cid = input("分类ID (空不限制): ").strip() or None
+                typ = input("类型 (0:收入 1:支出 空不限制): ").strip()
+                ttype = {"0": TxType.Income, "1": TxType.Expense}.get(typ)
+                lo = input("最小金额 (空不限制): ").strip()
+                hi = input("最大金额 (空不限制): ").strip()
+                lo = money.parse(lo) if lo else None
+                hi = money.parse(hi) if hi else None
+                res = tx_service.search(text, aid, cid, ttype, lo, hi)
+                print(f"搜索结果 {len(res)} 条：")
+                print_pages(list_pages(res))
+            elif choice == "14":
+                p = input("周期 1) 日 2) 周 3) 月 (默认月): ").strip()
+                period = {"1": "day", "2": "week", "3": "month"}.get(p, "month")
+                st = input("开始时间 (空不限制): ").strip()
+                ed = input("结束时间 (空不限制): ").strip()
+                path = input("报表 CSV 路径 (例如 report.csv): ").strip()
+                # one pass over the range, rows are written as each period completes
+                n = ReportEngine(tx_service.ledger).export_csv(path, period, st, ed,
+                                                               progress=make_progress("已写入"))
+                print()
+                print(f"已导出 {n} 行报表")
+            elif choice == "15":
+                aid = input("账户ID: ").strip()
+                dt = input("截至时间 (例如 2024-06-30T23:59:59，空为当前): ").strip()
+                bal = tx_service.balance_at(aid, dt)
+                print("未找到账户" if bal is None else f"余额: {money.format_cents(bal)}")
             elif choice == "0":
                 try:
-                    storage.save(txs, accounts, categories, applock)
+                    save_all()
                     print("已保存，退出")
                 except Exception as e:
                     print("保存失败:", e)
@@ -232,14 +382,19 @@ def main():
                 running = False
             else:
                 print("未知选项")
+            if autosaver is not None and choice in MUTATING_CHOICES:
+                autosaver.mark_dirty()
         except KeyboardInterrupt:
             print("\n捕获中断，保存后退出...")
-            storage.save(txs, accounts, categories, applock)
+            save_all()
             break
         except Exception as e:
             print("运行时异常：", e)
             traceback.print_exc()
 
+    if autosaver is not None:
+        autosaver.close()
+    storage.close()
     print("Bye")
 
 
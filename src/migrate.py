@@ -0,0 +1,48 @@
+"""
+migrate.py - 数据迁移工具：把加密数据文件 (data.enc) 转存到另一个后端（如 SQLite），反之亦然
+运行： python -m src.migrate data.enc data.db
+密码取自环境变量 FINANCEAPP_PASSWORD，未设置则交互输入；两端使用同一密码。
+"""
+import getpass
+import os
+import sys
+from .storage import open_storage, FORMAT_SEGMENTED
+
+
+def migrate(src_path: str, dst_path: str, password: str) -> int:
+    src = open_storage(src_path, password, FORMAT_SEGMENTED)
+    try:
+        txs, accts, cats, applock = src.load()
+    finally:
+        src.close()
+    dst = open_storage(dst_path, password, FORMAT_SEGMENTED)
+    try:
+        dst.save(txs, accts, cats, applock)
+    finally:
+        dst.close()
+    return len(txs)
+
+
+def main(argv=None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) != 2:
+        print("用法: python -m src.migrate <源文件> <目标文件>")
+        return 2
+    src_path, dst_path = args
+    if os.path.abspath(src_path) == os.path.abspath(dst_path):
+        print("源文件与目标文件不能相同")
+        return 2
+    password = os.environ.get("FINANCEAPP_PASSWORD")
+    if password is None:
+        password = getpass.getpass("请输入应用密码：")
+    try:
+        n = migrate(src_path, dst_path, password)
+    except Exception as e:
+        print("迁移失败:", e)
+        return 1
+    print(f"已迁移 {n} 条交易: {src_path} -> {dst_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,8 +4,25 @@ models.py - 数据模型（交易、账户、分类、应用锁）
 from dataclasses import dataclass, asdict
 from enum import Enum
 from typing import Optional, List
+import sys
 import time
 import json
+from . import money
+
+# __slots__ drops the per-instance __dict__ (Python 3.10+); transactions dominate memory on large ledgers
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+def intern_id(s: str) -> str:
+    # category/account ids repeat on every transaction; share one string object per id
+    return sys.intern(s) if s else s
+
+
+def _cents(d: dict, key: str) -> int:
+    # money is saved as integer cents under "<key>_cents"; older files hold float "<key>"
+    if key + "_cents" in d:
+        return int(d[key + "_cents"])
+    return money.from_float(d.get(key, 0.0))
 
 
 class TxType(str, Enum):
@@ -13,11 +30,18 @@ class TxType(str, Enum):
     Expense = "expense"
 
 
-@dataclass
+class ChangeOp(str, Enum):
+    # TransactionService change log entries: (op, tx_id, Transaction or None)
+    Add = "add"
+    Edit = "edit"
+    Delete = "delete"
+
+
+@dataclass(**_SLOTS)
 class Transaction:
     id: str
     type: TxType
-    amount: float
+    amount: money.Cents
     category_id: str
     account_id: str
     datetime: str  # ISO8601 string
@@ -25,47 +49,60 @@ class Transaction:
     receipt_path: str = ""
 
     def to_dict(self):
-        d = asdict(self)
-        d["type"] = self.type.value
-        return d
+        return {
+            "id": self.id,
+            "type": self.type.value,
+            "amount_cents": self.amount,
+            "category_id": self.category_id,
+            "account_id": self.account_id,
+            "datetime": self.datetime,
+            "remark": self.remark,
+            "receipt_path": self.receipt_path,
+        }
 
     @staticmethod
     def from_dict(d):
         return Transaction(
             id=d.get("id", ""),
             type=TxType(d.get("type", TxType.Expense.value)),
-            amount=float(d.get("amount", 0.0)),
-            category_id=d.get("category_id", ""),
-            account_id=d.get("account_id", ""),
+            amount=_cents(d, "amount"),
+            category_id=intern_id(d.get("category_id", "")),
+            account_id=intern_id(d.get("account_id", "")),
             datetime=d.get("datetime", ""),
             remark=d.get("remark", ""),
             receipt_path=d.get("receipt_path", ""),
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Account:
     id: str
     name: str
     icon: str = ""
-    initial_balance: float = 0.0
-    current_balance: float = 0.0
+    initial_balance: money.Cents = 0
+    current_balance: money.Cents = 0
 
     def to_dict(self):
-        return asdict(self)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "icon": self.icon,
+            "initial_balance_cents": self.initial_balance,
+            "current_balance_cents": self.current_balance,
+        }
 
     @staticmethod
     def from_dict(d):
         return Account(
-            id=d.get("id", ""),
+            id=intern_id(d.get("id", "")),
             name=d.get("name", ""),
             icon=d.get("icon", ""),
-            initial_balance=float(d.get("initial_balance", 0.0)),
-            current_balance=float(d.get("current_balance", 0.0)),
+            initial_balance=_cents(d, "initial_balance"),
+            current_balance=_cents(d, "current_balance"),
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Category:
     id: str
     name: str
@@ -81,7 +118,7 @@ class Category:
     @staticmethod
     def from_dict(d):
         return Category(
-            id=d.get("id", ""),
+            id=intern_id(d.get("id", "")),
             name=d.get("name", ""),
             icon=d.get("icon", ""),
             color=d.get("color", "#000000"),
@@ -89,7 +126,7 @@ class Category:
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class AppLock:
     enabled: bool = False
     password_hash: str = ""  # hex sha256
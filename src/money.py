@@ -0,0 +1,69 @@
+"""
+money.py - 金额以整数“分”(最小货币单位) 表示：解析十进制字符串、无损迁移旧的浮点金额、格式化输出
+Sums of ints are exact in any order, and the same values fit int64 columns (columnar.py).
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from typing import Union
+
+Cents = int  # amounts and balances in minor units (1/100)
+SCALE = 100
+_QUANT = Decimal(1)
+MAX_CENTS = 2 ** 63 - 1  # binfmt and the SQLite columns store amounts as int64
+
+
+def in_range(cents: Cents) -> bool:
+    return -MAX_CENTS <= cents <= MAX_CENTS
+
+
+def _checked(cents: Cents, value) -> Cents:
+    if not in_range(cents):
+        raise ValueError(f"amount out of range: {value!r}")
+    return cents
+
+
+def parse(text: str) -> Cents:
+    """Decimal string -> cents, exactly ("12.34" -> 1234, "-0.5" -> -50, "1,234.5" -> 123450).
+    More than two decimals round half-even; raises ValueError for anything else,
+    including amounts beyond MAX_CENTS."""
+    s = text.strip().replace(",", "")
+    try:
+        d = Decimal(s)
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: {text!r}")
+    if not d.is_finite():
+        raise ValueError(f"invalid amount: {text!r}")
+    if d.adjusted() > 20:  # far beyond int64; don't build a huge integer
+        raise ValueError(f"amount out of range: {text!r}")
+    return _checked(int((d * SCALE).quantize(_QUANT, rounding=ROUND_HALF_EVEN)), text)
+
+
+def from_float(value: float) -> Cents:
+    """Migrate a stored float: repr() is the shortest string that round-trips, so a value
+    that was entered with two decimals comes back exactly (0.29 -> 29, not 28)."""
+    if isinstance(value, int):
+        return value * SCALE
+    return parse(repr(float(value)))
+
+
+def to_cents(value: Union[str, int, float, Decimal]) -> Cents:
+    """Amounts from user code: str and Decimal are parsed, int is taken as units (yuan),
+    float goes through from_float."""
+    if isinstance(value, bool):
+        raise ValueError(f"invalid amount: {value!r}")
+    if isinstance(value, int):
+        return _checked(value * SCALE, value)
+    if isinstance(value, float):
+        return from_float(value)
+    return parse(str(value))
+
+
+def format_cents(cents: Cents) -> str:
+    """1234 -> "12.34", -5 -> "-0.05"; parse(format_cents(c)) == c."""
+    sign = "-" if cents < 0 else ""
+    units, minor = divmod(abs(cents), SCALE)
+    return f"{sign}{units}.{minor:02d}"
+
+
+def to_float(cents: Cents) -> float:
+    # for display / interop only; never feed back into sums
+    return cents / SCALE
@@ -0,0 +1,124 @@
+"""
+reports.py - 报表引擎：按日/周/月一次扫描同时得到收支合计、按账户、按分类的金额与笔数以及各账户期末余额，
+逐期产出结果，可流式写入 CSV；内存只与单个周期内的分组数有关，与交易总数无关。
+"""
+import datetime
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Tuple, Iterator, Callable
+from .models import TxType
+from .ledger import Ledger
+from . import utils, money
+
+PERIODS = ("day", "week", "month")
+REPORT_HEADER = ["period", "dimension", "key", "name", "income", "expense", "net", "count", "balance"]
+
+
+def period_key(dt: str, period: str) -> str:
+    """"2024-03-05T10:00:00" -> "2024-03-05" (day), "2024-W10" (ISO week) or "2024-03" (month).
+    Keys never decrease along datetime order, so a sorted scan sees each period once."""
+    if period == "month":
+        return dt[:7]
+    if period == "week":
+        try:
+            year, week, _ = datetime.date.fromisoformat(dt[:10]).isocalendar()
+        except ValueError:
+            return dt[:10]
+        return f"{year}-W{week:02d}"
+    if period == "day":
+        return dt[:10]
+    raise ValueError(f"unknown period: {period!r}")
+
+
+@dataclass
+class PeriodSummary:
+    period: str
+    income: money.Cents = 0
+    expense: money.Cents = 0
+    count: int = 0
+    accounts: Dict[str, List[int]] = field(default_factory=dict)  # id -> [income, expense, count]
+    categories: Dict[Tuple[TxType, str], List[int]] = field(default_factory=dict)  # (type, id) -> [sum, count]
+    balances: Dict[str, money.Cents] = field(default_factory=dict)  # every account, at the end of the period
+
+
+class ReportEngine:
+    """Reads the shared Ledger through its date index; nothing is cached between reports."""
+
+    def __init__(self, ledger: Ledger):
+        self.ledger = ledger
+
+    def opening_balances(self, start_iso: str = "") -> Dict[str, money.Cents]:
+        """Balance of every account just before start_iso (initial balances if empty)."""
+        index = self.ledger.index
+        out = {a.id: a.initial_balance for a in self.ledger.accounts}
+        i, _ = index.date_bounds(start_iso, "")
+        for t in index.date_slice(0, i):
+            if t.account_id in out:
+                out[t.account_id] += t.amount if t.type == TxType.Income else -t.amount
+        return out
+
+    def periods(self, period: str = "month", start_iso: str = "", end_iso: str = "") -> Iterator[PeriodSummary]:
+        """One PeriodSummary per period holding transactions in [start_iso, end_iso], in
+        order; all dimensions come from a single scan of the range."""
+        if period not in PERIODS:
+            raise ValueError(f"unknown period: {period!r}")
+        keys: Dict[str, str] = {}  # day prefix -> period key, computed once per day
+        balances = self.opening_balances(start_iso)
+        cur: Optional[PeriodSummary] = None
+        for t in self.ledger.index.date_range(start_iso, end_iso):
+            day = t.datetime[:10]
+            key = keys.get(day)
+            if key is None:
+                key = keys[day] = period_key(t.datetime, period)
+            if cur is None or key != cur.period:
+                if cur is not None:
+                    cur.balances = dict(balances)
+                    yield cur
+                cur = PeriodSummary(key)
+            income = t.type == TxType.Income
+            cur.count += 1
+            acc = cur.accounts.get(t.account_id)
+            if acc is None:
+                acc = cur.accounts[t.account_id] = [0, 0, 0]
+            acc[2] += 1
+            cat = cur.categories.get((t.type, t.category_id))
+            if cat is None:
+                cat = cur.categories[(t.type, t.category_id)] = [0, 0]
+            cat[0] += t.amount
+            cat[1] += 1
+            if income:
+                cur.income += t.amount
+                acc[0] += t.amount
+            else:
+                cur.expense += t.amount
+                acc[1] += t.amount
+            if t.account_id in balances:
+                balances[t.account_id] += t.amount if income else -t.amount
+        if cur is not None:
+            cur.balances = dict(balances)
+            yield cur
+
+    def rows(self, period: str = "month", start_iso: str = "", end_iso: str = "") -> Iterator[Dict]:
+        """periods() flattened to REPORT_HEADER rows; dimension is total, account,
+        category or balance (the account's running balance at the end of the period)."""
+        index = self.ledger.index
+        fmt = money.format_cents
+        for p in self.periods(period, start_iso, end_iso):
+            yield {"period": p.period, "dimension": "total", "income": fmt(p.income), "expense": fmt(p.expense),
+                   "net": fmt(p.income - p.expense), "count": p.count}
+            for aid, (inc, exp, n) in sorted(p.accounts.items()):
+                yield {"period": p.period, "dimension": "account", "key": aid, "name": index.account_name(aid),
+                       "income": fmt(inc), "expense": fmt(exp), "net": fmt(inc - exp), "count": n}
+            for (typ, cid), (total, n) in sorted(p.categories.items()):
+                income = typ == TxType.Income
+                yield {"period": p.period, "dimension": "category", "key": cid, "name": index.category_name(cid),
+                       "income": fmt(total if income else 0), "expense": fmt(0 if income else total),
+                       "net": fmt(total if income else -total), "count": n}
+            for aid, bal in p.balances.items():
+                yield {"period": p.period, "dimension": "balance", "key": aid, "name": index.account_name(aid),
+                       "balance": fmt(bal)}
+
+    def export_csv(self, path: str, period: str = "month", start_iso: str = "", end_iso: str = "",
+                   chunk_size: int = utils.CSV_CHUNK_SIZE,
+                   progress: Optional[Callable[[int], None]] = None) -> int:
+        """Stream rows() to path; returns the number of rows written."""
+        return utils.write_csv(path, REPORT_HEADER, self.rows(period, start_iso, end_iso), chunk_size, progress)
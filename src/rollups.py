@@ -0,0 +1,148 @@
+"""
+rollups.py - 预聚合统计：按 (日/月, 类型, 分类, 账户) 维护金额小计，区间统计用日前缀和 + 月桶组合
+边界上不足一整天的部分回退到按时间索引扫描原始交易。
+"""
+from bisect import bisect_left, insort
+from typing import List, Optional, Dict, Tuple, Iterator
+from .models import Transaction, TxType
+from .index import LedgerIndex
+
+CellKey = Tuple[str, str, str]  # (type value, category_id, account_id)
+
+
+def _cell_key(tx: Transaction) -> CellKey:
+    return tx.type.value, tx.category_id, tx.account_id
+
+
+class RollupStore:
+    def __init__(self, txs: List[Transaction], index: LedgerIndex):
+        self.txs = txs
+        self.index = index
+        self._days: List[str] = []  # sorted day keys (datetime[:10]) that hold data
+        self._day_cells: Dict[str, Dict[CellKey, List]] = {}  # day -> key -> [sum, count]
+        self._month_cells: Dict[str, Dict[CellKey, List]] = {}  # month (datetime[:7]) -> key -> [sum, count]
+        self._day_totals: Dict[str, List[int]] = {}  # day -> [income, expense]
+        self._prefix: Optional[List[Tuple[int, int]]] = None
+        self.rebuild()
+
+    def rebuild(self):
+        self._days = []
+        self._day_cells = {}
+        self._month_cells = {}
+        self._day_totals = {}
+        self._prefix = None
+        for t in self.txs:
+            self.add(t)
+
+    # --- maintenance ---
+
+    def add(self, tx: Transaction):
+        self._update(tx, 1)
+
+    def remove(self, tx: Transaction):
+        self._update(tx, -1)
+
+    def _update(self, tx: Transaction, sign: int):
+        day = tx.datetime[:10]
+        key = _cell_key(tx)
+        cells = self._day_cells.get(day)
+        if cells is None:
+            if sign < 0:
+                return
+            cells = self._day_cells[day] = {}
+            self._day_totals[day] = [0, 0]
+            insort(self._days, day)
+        self._bump(cells, key, tx.amount, sign)
+        self._bump(self._month_cells.setdefault(day[:7], {}), key, tx.amount, sign)
+        totals = self._day_totals[day]
+        totals[0 if tx.type == TxType.Income else 1] += sign * tx.amount
+        if not cells:
+            del self._day_cells[day]
+            del self._day_totals[day]
+            del self._days[bisect_left(self._days, day)]
+            if not self._month_cells[day[:7]]:
+                del self._month_cells[day[:7]]
+        self._prefix = None
+
+    @staticmethod
+    def _bump(cells: Dict[CellKey, List], key: CellKey, amount: int, sign: int):
+        c = cells.get(key)
+        if c is None:
+            c = cells[key] = [0, 0]
+        c[0] += sign * amount
+        c[1] += sign
+        if c[1] <= 0:
+            del cells[key]
+
+    # --- queries ---
+
+    def _prefix_sums(self) -> List[Tuple[int, int]]:
+        if self._prefix is None:
+            inc = exp = 0
+            prefix = [(0, 0)]
+            for d in self._days:
+                t = self._day_totals[d]
+                inc += t[0]
+                exp += t[1]
+                prefix.append((inc, exp))
+            self._prefix = prefix
+        return self._prefix
+
+    def _split(self, start_iso: str, end_iso: str) -> Tuple[int, int, List[Transaction]]:
+        """Days [lo, hi) of self._days lie entirely inside the range; the returned raw
+        transactions cover the partial days at either edge."""
+        days = self._days
+        lo = bisect_left(days, start_iso) if start_iso else 0
+        hi = bisect_left(days, end_iso[:10]) if end_iso else len(days)
+        index = self.index
+        i, j = index.date_bounds(start_iso, end_iso)
+        if lo >= hi:
+            return lo, lo, index.date_slice(i, j)
+        p = index.date_position(days[lo])
+        q = index.date_position(end_iso[:10]) if end_iso else j
+        return lo, hi, index.date_slice(i, p) + index.date_slice(q, j)
+
+    def totals(self, start_iso: str = "", end_iso: str = "") -> Tuple[int, int]:
+        lo, hi, raw = self._split(start_iso, end_iso)
+        prefix = self._prefix_sums()
+        inc = prefix[hi][0] - prefix[lo][0]
+        exp = prefix[hi][1] - prefix[lo][1]
+        for t in raw:
+            if t.type == TxType.Income:
+                inc += t.amount
+            else:
+                exp += t.amount
+        return inc, exp
+
+    def cells(self, start_iso: str = "", end_iso: str = "") -> Iterator[Tuple[CellKey, int]]:
+        """(type, category_id, account_id) partial sums covering the range; a key may repeat."""
+        lo, hi, raw = self._split(start_iso, end_iso)
+        days = self._days
+        k = lo
+        while k < hi:
+            month = days[k][:7]
+            if len(month) < 7:
+                # short, non-ISO datetime: its month bucket holds just this day
+                s, e = k, k + 1
+            else:
+                s = bisect_left(days, month)
+                e = bisect_left(days, month + "\uffff")
+            if s >= lo and e <= hi:
+                for key, c in self._month_cells[month].items():
+                    yield key, c[0]
+                k = e
+            else:
+                stop = min(e, hi)
+                for d in days[k:stop]:
+                    for key, c in self._day_cells[d].items():
+                        yield key, c[0]
+                k = stop
+        for t in raw:
+            yield _cell_key(t), t.amount
+
+    def category_totals(self, tx_type: TxType, start_iso: str = "", end_iso: str = "") -> Dict[str, int]:
+        sums: Dict[str, int] = {}
+        for (typ, cid, _), amount in self.cells(start_iso, end_iso):
+            if typ == tx_type.value:
+                sums[cid] = sums.get(cid, 0) + amount
+        return sums
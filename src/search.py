@@ -0,0 +1,179 @@
+"""
+search.py - 交易搜索索引：备注倒排索引（拉丁词 + 中文单字/双字分词）、账户/分类/类型倒排表、按金额排序的区间索引，
+订阅 Ledger 的增删改增量维护；多条件查询从最小的候选集合开始求交集。
+"""
+import re
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Dict, Set, Iterable
+from .models import Transaction, TxType
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"  # CJK unified ideographs (+ ext. A, compatibility)
+_WORD_RE = re.compile(r"[^\W_]+")
+_CJK_RUN_RE = re.compile(f"([{_CJK}]+)")
+
+
+def _runs(text: str) -> Iterable[str]:
+    # words, with CJK runs split out of them (CJK text has no spaces between words)
+    for word in _WORD_RE.findall(text.casefold()):
+        for part in _CJK_RUN_RE.split(word):
+            if part:
+                yield part
+
+
+def _is_cjk(run: str) -> bool:
+    return _CJK_RUN_RE.match(run) is not None
+
+
+def tokenize(text: str) -> Set[str]:
+    """Index terms: latin/digit words as-is, CJK runs as single characters plus bigrams."""
+    out = set()
+    if not text:
+        return out
+    for run in _runs(text):
+        if _is_cjk(run):
+            out.update(run)
+            out.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            out.add(run)
+    return out
+
+
+def query_terms(text: str) -> Set[str]:
+    """Terms a query must all match: a single CJK character matches its unigram, longer
+    CJK runs match all of their bigrams."""
+    out = set()
+    for run in _runs(text):
+        if _is_cjk(run) and len(run) > 1:
+            out.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            out.add(run)
+    return out
+
+
+class SearchIndex:
+    """Postings hold id(tx) of the indexed objects, so the index follows the ledger's
+    add/remove hooks exactly like ColumnarStore."""
+
+    def __init__(self, txs: List[Transaction]):
+        self.txs = txs
+        self.rebuild()
+
+    def rebuild(self):
+        self._docs: Dict[int, Transaction] = {}
+        self._terms: Dict[str, Set[int]] = {}
+        self._accounts: Dict[str, Set[int]] = {}
+        self._categories: Dict[str, Set[int]] = {}
+        self._types: Dict[TxType, Set[int]] = {}
+        # amount index: two parallel lists ordered by amount (cents)
+        self._amounts: List[int] = []
+        self._amount_keys: List[int] = []
+        seen: Dict[str, Set[str]] = {}  # remarks repeat a lot; tokenize each distinct one once
+        for t in self.txs:
+            terms = seen.get(t.remark)
+            if terms is None:
+                terms = seen[t.remark] = tokenize(t.remark)
+            self._add_postings(t, terms)
+        ordered = sorted((t.amount, k) for k, t in self._docs.items())
+        self._amounts = [a for a, _ in ordered]
+        self._amount_keys = [k for _, k in ordered]
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # --- maintenance ---
+
+    def _add_postings(self, tx: Transaction, terms: Set[str]) -> bool:
+        k = id(tx)
+        if k in self._docs:
+            return False
+        self._docs[k] = tx
+        for term in terms:
+            self._post(self._terms, term, k)
+        self._post(self._accounts, tx.account_id, k)
+        self._post(self._categories, tx.category_id, k)
+        self._post(self._types, tx.type, k)
+        return True
+
+    @staticmethod
+    def _post(postings: Dict, key, k: int):
+        s = postings.get(key)
+        if s is None:
+            s = postings[key] = set()
+        s.add(k)
+
+    def add(self, tx: Transaction):
+        if not self._add_postings(tx, tokenize(tx.remark)):
+            return
+        i = bisect_right(self._amounts, tx.amount)
+        self._amounts.insert(i, tx.amount)
+        self._amount_keys.insert(i, id(tx))
+
+    def remove(self, tx: Transaction):
+        k = id(tx)
+        if self._docs.pop(k, None) is None:
+            return
+        for term in tokenize(tx.remark):
+            self._discard(self._terms, term, k)
+        self._discard(self._accounts, tx.account_id, k)
+        self._discard(self._categories, tx.category_id, k)
+        self._discard(self._types, tx.type, k)
+        lo = bisect_left(self._amounts, tx.amount)
+        hi = bisect_right(self._amounts, tx.amount, lo)
+        for i in range(lo, hi):
+            if self._amount_keys[i] == k:
+                del self._amounts[i]
+                del self._amount_keys[i]
+                break
+
+    @staticmethod
+    def _discard(postings: Dict, key, k: int):
+        s = postings.get(key)
+        if s is not None:
+            s.discard(k)
+            if not s:
+                del postings[key]
+
+    # --- queries ---
+
+    def search(self, text: str = "", account_id: Optional[str] = None, category_id: Optional[str] = None,
+               tx_type: Optional[TxType] = None, min_amount: Optional[int] = None,
+               max_amount: Optional[int] = None, limit: Optional[int] = None) -> List[Transaction]:
+        """
+        Transactions matching every given condition, ordered by (datetime, id). text
+        matches remarks by whole terms (all query terms must occur); amounts are inclusive, in cents.
+        """
+        sets: List[Set[int]] = []
+        for term in query_terms(text):
+            sets.append(self._terms.get(term, set()))
+        if account_id is not None:
+            sets.append(self._accounts.get(account_id, set()))
+        if category_id is not None:
+            sets.append(self._categories.get(category_id, set()))
+        if tx_type is not None:
+            sets.append(self._types.get(tx_type, set()))
+        ranged = min_amount is not None or max_amount is not None
+        if ranged:
+            i = bisect_left(self._amounts, min_amount) if min_amount is not None else 0
+            j = bisect_right(self._amounts, max_amount) if max_amount is not None else len(self._amounts)
+            j = max(i, j)
+        sets.sort(key=len)
+        if ranged and (not sets or j - i < len(sets[0])):
+            # the amount range is the most selective condition: drive from it
+            keys = set(self._amount_keys[i:j])
+            ranged = False
+        elif sets:
+            keys = sets[0]
+            sets = sets[1:]
+        else:
+            keys = self._docs.keys()
+        out = []
+        for k in keys:
+            if any(k not in s for s in sets):
+                continue
+            t = self._docs[k]
+            if ranged and not ((min_amount is None or t.amount >= min_amount) and
+                               (max_amount is None or t.amount <= max_amount)):
+                continue
+            out.append(t)
+        out.sort(key=lambda t: (t.datetime, t.id))
+        return out if limit is None else out[:limit]
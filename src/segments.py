@@ -0,0 +1,353 @@
+"""
+segments.py - 分段加密存储格式：交易变更按段追加写入，每段独立 AES-GCM 认证，另有加密清单 (manifest)
+File format (binary):
+  4 bytes magic: b'FAS1', u16 version, u16 reserved, 16 bytes salt
+  records, repeated:
+    u32 body length, u8 kind, u32 seq
+    body: 12 bytes nonce + ciphertext (AES-GCM tag included)
+    AAD = magic + salt + kind + seq, so a record cannot be moved to another file or seq
+  kind 1 segment:  ordered change ops (add / edit / delete) encoded with binfmt
+                   (version 1 files: binfmt version 1, float amounts)
+  kind 2 manifest: JSON with accounts, categories, applock and the list of live segments;
+                   each entry pins its record's nonce, so a record left over from an older
+                   generation of the file (same salt, offset and seq after a rewrite) is rejected
+The last manifest that decrypts is authoritative. Anything after it (a torn append) is
+ignored and cut off by the next write. A save appends one or more segments holding the
+changes since the previous save plus a new manifest; compaction rewrites the file as
+base segments of SEGMENT_ROWS transactions each. Replacing the whole file with an older
+copy of itself cannot be detected from the file alone.
+"""
+import json
+import os
+import struct
+from bisect import insort
+from typing import List, Optional, Dict, Tuple
+from .models import Transaction, Account, Category, AppLock, ChangeOp
+from . import binfmt, encryption, utils
+
+MAGIC = b"FAS1"
+VERSION = 2
+KIND_SEGMENT = 1
+KIND_MANIFEST = 2
+SEGMENT_ROWS = 50_000
+# compact once the file has this many segments, or the appended ops outgrow the base
+MAX_SEGMENTS = 64
+MIN_COMPACT_OPS = 10_000
+
+_HEADER = struct.Struct("<4sHH")
+_RECORD = struct.Struct("<IBI")
+_OP_CODES = {ChangeOp.Add: 0, ChangeOp.Edit: 1, ChangeOp.Delete: 2}
+OPS = [ChangeOp.Add, ChangeOp.Edit, ChangeOp.Delete]
+
+Change = Tuple[ChangeOp, str, Optional[Transaction]]
+
+
+def is_segmented(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode_ops(changes: List[Change]) -> bytes:
+    w = binfmt.Writer()
+    w.u32(len(changes))
+    w.parts.append(bytes(_OP_CODES[op] for op, _, _ in changes))
+    w.strings([tx_id for _, tx_id, _ in changes])
+    w.transactions([tx for op, _, tx in changes if op != ChangeOp.Delete])
+    return w.getvalue()
+
+
+def decode_ops(data: bytes, binfmt_version: int = binfmt.VERSION) -> Tuple[bytes, List[str], List[Transaction]]:
+    """(op codes, target ids, transactions of the add/edit ops)"""
+    r = binfmt.Reader(data, version=binfmt_version)
+    n = r.u32()
+    codes = r.raw(n)
+    ids = r.strings(n)
+    return codes, ids, r.transactions()
+
+
+def batch_changes(codes: bytes, ids: List[str], txs: List[Transaction]) -> List[Change]:
+    """decode_ops() output back to change tuples."""
+    it = iter(txs)
+    return [(OPS[c], tx_id, None if OPS[c] == ChangeOp.Delete else next(it)) for c, tx_id in zip(codes, ids)]
+
+
+def adds_only(entries: List[Dict]) -> bool:
+    # older manifests lack the flag; treat those segments as holding edits
+    return all(e.get("adds_only") for e in entries)
+
+
+def overlapping(entries: List[Dict], start_iso: str = "", end_iso: str = "") -> List[Dict]:
+    """Segments that may hold a transaction with start_iso <= datetime <= end_iso."""
+    out = []
+    for e in entries:
+        if not e["min_dt"] and not e["max_dt"]:
+            continue
+        if (start_iso and e["max_dt"] < start_iso) or (end_iso and e["min_dt"] > end_iso):
+            continue
+        out.append(e)
+    return out
+
+
+class Replay:
+    """Applies change ops with TransactionService semantics: edit/delete hit the first
+    live transaction with that id; deleted slots are dropped at the end."""
+
+    def __init__(self):
+        self.slots: List[Optional[Transaction]] = []
+        # id -> first slot, built on the first edit/delete; pure appends (the base
+        # segments) never need it
+        self.first: Optional[Dict[str, int]] = None
+        self.dups: Dict[str, List[int]] = {}  # later occurrences of a duplicated id, ascending
+
+    def _build(self):
+        self.first = {}
+        for i, t in enumerate(self.slots):
+            if t is not None:
+                self._link(t.id, i)
+
+    def apply_segment(self, codes: bytes, ids: List[str], txs: List[Transaction]):
+        if self.first is None and not codes.strip(b"\x00"):
+            self.slots.extend(txs)
+            return
+        for op, tx_id, tx in batch_changes(codes, ids, txs):
+            self.apply(op, tx_id, tx)
+
+    def _link(self, tx_id: str, i: int):
+        cur = self.first.get(tx_id)
+        if cur is None:
+            self.first[tx_id] = i
+        elif i < cur:
+            insort(self.dups.setdefault(tx_id, []), cur)
+            self.first[tx_id] = i
+        else:
+            insort(self.dups.setdefault(tx_id, []), i)
+
+    def _unlink(self, tx_id: str, i: int):
+        rest = self.dups.get(tx_id)
+        if self.first.get(tx_id) == i:
+            if rest:
+                self.first[tx_id] = rest.pop(0)
+            else:
+                del self.first[tx_id]
+        elif rest:
+            rest.remove(i)
+        if rest is not None and not rest:
+            del self.dups[tx_id]
+
+    def apply(self, op: ChangeOp, tx_id: str, tx: Optional[Transaction]):
+        if self.first is None:
+            self._build()
+        if op == ChangeOp.Add:
+            self.slots.append(tx)
+            self._link(tx.id, len(self.slots) - 1)
+            return
+        i = self.first.get(tx_id)
+        if i is None:
+            return
+        if op == ChangeOp.Edit:
+            self.slots[i] = tx
+            if tx.id != tx_id:
+                self._unlink(tx_id, i)
+                self._link(tx.id, i)
+        else:
+            self._unlink(tx_id, i)
+            self.slots[i] = None
+
+    def result(self) -> List[Transaction]:
+        return [t for t in self.slots if t is not None]
+
+
+class SegmentedFile:
+    def __init__(self, path: str, keys: encryption.KeySession):
+        self.path = path
+        self.keys = keys
+        self.salt: Optional[bytes] = None
+        self.version = VERSION  # of the file on disk
+        self.segments: List[Dict] = []  # manifest entries: offset, seq, nonce, ops, min_dt, max_dt, adds_only
+        self.base_rows = 0  # rows written by the last compaction
+        self.delta_ops = 0  # ops appended since then
+        self.seq = 0  # seq of the next record
+        self.end = 0  # end offset of the last valid manifest
+        self.token = b""  # nonce of the last valid manifest, identifies this checkpoint
+        # True while self mirrors the file on disk, i.e. appending a delta is safe
+        self.synced = False
+
+    # --- records ---
+
+    def _aad(self, kind: int, seq: int) -> bytes:
+        return MAGIC + self.salt + bytes([kind]) + struct.pack("<I", seq)
+
+    def _record(self, kind: int, payload: bytes, nonce: Optional[bytes] = None) -> bytes:
+        body = self.keys.seal(self.salt, payload, self._aad(kind, self.seq), nonce)
+        out = _RECORD.pack(len(body), kind, self.seq) + body
+        self.seq += 1
+        return out
+
+    def _open_record(self, data: bytes, offset: int) -> Tuple[int, int, bytes]:
+        length, kind, seq = _RECORD.unpack_from(data, offset)
+        body = data[offset + _RECORD.size:offset + _RECORD.size + length]
+        nonce, ct = body[:encryption.NONCE_SIZE], body[encryption.NONCE_SIZE:]
+        return kind, seq, self.keys.aead(self.salt).decrypt(nonce, ct, self._aad(kind, seq))
+
+    @staticmethod
+    def _nonce_at(data: bytes, offset: int) -> bytes:
+        start = offset + _RECORD.size
+        return bytes(data[start:start + encryption.NONCE_SIZE])
+
+    def _scan(self, data: bytes) -> List[Tuple[int, int, int]]:
+        """(offset, kind, end) of every complete record."""
+        out = []
+        pos = _HEADER.size + encryption.SALT_SIZE
+        while pos + _RECORD.size <= len(data):
+            length, kind, _ = _RECORD.unpack_from(data, pos)
+            end = pos + _RECORD.size + length
+            if end > len(data):
+                break
+            out.append((pos, kind, end))
+            pos = end
+        return out
+
+    # --- load ---
+
+    def read_manifest(self, data: bytes) -> Dict:
+        magic, version, _ = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Invalid file format (magic mismatch)")
+        if version > VERSION:
+            raise ValueError(f"Unsupported segmented file version {version}")
+        self.version = version
+        self.salt = data[_HEADER.size:_HEADER.size + encryption.SALT_SIZE]
+        records = self._scan(data)
+        last_error: Optional[Exception] = None
+        for offset, kind, end in reversed(records):
+            if kind != KIND_MANIFEST:
+                continue
+            try:
+                _, seq, payload = self._open_record(data, offset)
+            except Exception as e:  # torn or corrupt tail, or wrong password
+                last_error = e
+                continue
+            manifest = json.loads(payload.decode("utf-8"))
+            self.segments = manifest.get("segments", [])
+            self.base_rows = manifest.get("base_rows", 0)
+            self.delta_ops = manifest.get("delta_ops", 0)
+            self.seq = seq + 1
+            self.end = end
+            self.token = self._nonce_at(data, offset)
+            self.keys.adopt_salt(self.salt)
+            return manifest
+        raise ValueError(f"No readable manifest: {last_error!r}")
+
+    def read_segment(self, data: bytes, entry: Dict) -> Tuple[bytes, List[str], List[Transaction]]:
+        # entries written before nonces were pinned have no "nonce"
+        nonce = entry.get("nonce")
+        if nonce is not None and self._nonce_at(data, entry["offset"]).hex() != nonce:
+            raise ValueError("Manifest does not match segment record")
+        kind, seq, payload = self._open_record(data, entry["offset"])
+        if kind != KIND_SEGMENT or seq != entry["seq"]:
+            raise ValueError("Manifest does not match segment record")
+        return decode_ops(payload, binfmt.VERSION if self.version >= 2 else 1)
+
+    def open(self, data: bytes) -> Tuple[List[Account], List[Category], AppLock]:
+        """Read only the manifest; segments are decrypted later with read_segment()."""
+        self.synced = False
+        meta = self._meta_from(self.read_manifest(data))
+        self.synced = True
+        return meta
+
+    def load(self, data: bytes) -> Tuple[List[Transaction], List[Account], List[Category], AppLock]:
+        accts, cats, applock = self.open(data)
+        return self.replay(data, self.segments), accts, cats, applock
+
+    def replay(self, data: bytes, entries: List[Dict]) -> List[Transaction]:
+        replay = Replay()
+        for entry in entries:
+            replay.apply_segment(*self.read_segment(data, entry))
+        return replay.result()
+
+    @staticmethod
+    def _meta_from(manifest: Dict) -> Tuple[List[Account], List[Category], AppLock]:
+        accts = [Account.from_dict(a) for a in manifest.get("accounts", [])]
+        cats = [Category.from_dict(c) for c in manifest.get("categories", [])]
+        applock = AppLock.from_dict(manifest["applock"]) if manifest.get("applock") else AppLock()
+        return accts, cats, applock
+
+    # --- save ---
+
+    def needs_compaction(self, new_ops: int) -> bool:
+        # a rewrite also moves the file to a fresh salt once its key is used up
+        if not self.synced or self.version != VERSION or self.keys.exhausted(self.salt):
+            return True
+        chunks = (new_ops + SEGMENT_ROWS - 1) // SEGMENT_ROWS
+        if len(self.segments) + chunks > MAX_SEGMENTS:
+            return True
+        return self.delta_ops + new_ops > max(self.base_rows // 2, MIN_COMPACT_OPS)
+
+    def _segments_for(self, changes: List[Change], start: int) -> Tuple[List[bytes], int]:
+        parts = []
+        pos = start
+        for chunk in utils.chunked(changes, SEGMENT_ROWS):
+            dts = [tx.datetime for _, _, tx in chunk if tx is not None]
+            rec = self._record(KIND_SEGMENT, encode_ops(chunk))
+            self.segments.append({
+                "offset": pos,
+                "seq": self.seq - 1,
+                "nonce": self._nonce_at(rec, 0).hex(),
+                "ops": len(chunk),
+                "min_dt": min(dts) if dts else "",
+                "max_dt": max(dts) if dts else "",
+                "adds_only": all(op == ChangeOp.Add for op, _, _ in chunk),
+            })
+            parts.append(rec)
+            pos += len(rec)
+        return parts, pos
+
+    def _manifest(self, accts: List[Account], cats: List[Category], applock: AppLock,
+                  token: Optional[bytes] = None) -> bytes:
+        manifest = {
+            "accounts": [a.to_dict() for a in accts],
+            "categories": [c.to_dict() for c in cats],
+            "applock": applock.to_dict(),
+            "segments": self.segments,
+            "base_rows": self.base_rows,
+            "delta_ops": self.delta_ops,
+        }
+        payload = json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return self._record(KIND_MANIFEST, payload, token)
+
+    def write_full(self, txs: List[Transaction], accts: List[Account], cats: List[Category], applock: AppLock,
+                   token: Optional[bytes] = None):
+        """Compaction: rewrite everything as base segments of SEGMENT_ROWS adds each.
+        token: the new checkpoint's token (manifest nonce) if chosen ahead, else random."""
+        self.synced = False
+        self.salt = self.keys.salt
+        self.version = VERSION
+        self.seq = 0
+        self.segments = []
+        head = _HEADER.pack(MAGIC, VERSION, 0) + self.salt
+        parts, pos = self._segments_for([(ChangeOp.Add, t.id, t) for t in txs], len(head))
+        self.base_rows = len(txs)
+        self.delta_ops = 0
+        manifest = self._manifest(accts, cats, applock, token)
+        utils.atomic_write_bytes(self.path, b"".join([head] + parts + [manifest]))
+        self.end = pos + len(manifest)
+        self.token = self._nonce_at(manifest, 0)
+        self.synced = True
+
+    def append(self, changes: List[Change], accts: List[Account], cats: List[Category], applock: AppLock,
+               token: Optional[bytes] = None):
+        """Append segments for changes plus a new manifest; cost scales with the change."""
+        self.synced = False
+        parts, pos = self._segments_for(changes, self.end)
+        self.delta_ops += len(changes)
+        manifest = self._manifest(accts, cats, applock, token)
+        with open(self.path, "r+b") as f:
+            f.seek(self.end)
+            f.truncate()
+            for p in parts:
+                f.write(p)
+            f.write(manifest)
+            f.flush()
+            os.fsync(f.fileno())
+        self.end = pos + len(manifest)
+        self.token = self._nonce_at(manifest, 0)
+        self.synced = True
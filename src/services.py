@@ -1,49 +1,204 @@
 """
 services.py - 事务、统计、导入导出等业务逻辑
 """
-from typing import List, Optional, Dict, Tuple
-from .models import Transaction, Account, Category, TxType
-from . import utils
+from typing import List, Optional, Dict, Tuple, Iterable, Iterator, Callable
+from .models import Transaction, Account, Category, TxType, ChangeOp, intern_id
+from .index import LedgerIndex
+from .rollups import RollupStore
+from .columnar import ColumnarStore
+from .search import SearchIndex
+from .checkpoints import BalanceCheckpoints
+from .journal import Journal
+from .ledger import Ledger
+from . import utils, binfmt, money
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import copy
+import csv
 import datetime
+import threading
+import time
+
+MAX_REPORTED_ERRORS = 20  # per file, in import reports
+STATS_CACHE_SIZE = 256  # memoized StatisticsService results
+
+
+# (datetime, id) of the last row of a page, and how many rows with that same key (ids
+# may repeat) have been returned so far
+Cursor = Tuple[str, str, int]
 
 
 class TransactionService:
-    def __init__(self, txs: List[Transaction], accounts: List[Account], categories: List[Category]):
-        self.txs = txs
-        self.accounts = accounts
-        self.categories = categories
+    def __init__(self, ledger: Ledger, columnar: bool = False, journal: Optional[Journal] = None,
+                 trust_balances: bool = False, checkpoints: Optional[Dict] = None):
+        # shared with StatisticsService; all mutations go through it (see ledger.py)
+        self.ledger = ledger
+        self.rollups = ledger.subscribe(RollupStore(ledger.txs, ledger.index))
+        # optional numpy view for vectorized analytics (see columnar.py)
+        self.columnar = ledger.subscribe(ColumnarStore(ledger.txs)) if columnar else None
+        self._search: Optional[SearchIndex] = None  # built on the first search()
+        # monthly balance checkpoints; checkpoints is what storage.load_extra() kept from the last save
+        self.checkpoints = ledger.subscribe(BalanceCheckpoints(ledger, checkpoints))
+        # mutations since the last take_changes(), in order; lets storage append only the delta
+        self.changes: List[Tuple[ChangeOp, str, Optional[Transaction]]] = []
+        # write-ahead journal (LocalStorage.journal); each public mutation is one group commit
+        self.journal = journal
+        self._in_batch = False  # add_transactions() running: commit once at its end
+        # held by every mutation; a background saver takes it only to snapshot (see autosave.py)
+        self.lock = threading.RLock()
+        # trust_balances: the accounts come from a snapshot saved together with txs
+        if not trust_balances:
+            self.recalculate_balances()
+
+    @property
+    def txs(self) -> List[Transaction]:
+        return self.ledger.txs
+
+    @property
+    def accounts(self) -> List[Account]:
+        return self.ledger.accounts
+
+    @property
+    def categories(self) -> List[Category]:
+        return self.ledger.categories
+
+    @property
+    def index(self) -> LedgerIndex:
+        return self.ledger.index
 
     def add_transaction(self, tx: Transaction) -> Transaction:
-        if not tx.id:
-            tx.id = utils.generate_uuid()
-        self.txs.append(tx)
-        self.recalculate_balances()
-        return tx
+        """Raises ValueError for an invalid type or amount, before anything changes."""
+        self._check(tx)
+        with self.lock:
+            if not tx.id:
+                tx.id = utils.generate_uuid()
+            self.ledger.append(tx)
+            self._log(ChangeOp.Add, tx.id, tx)
+            self._commit()
+            return tx
+
+    def add_transactions(self, txs: Iterable[Transaction], dates: bool = True) -> Tuple[List[Transaction], int]:
+        """Bulk insert in one pass: validate, skip ids already present (or repeated in the
+        batch), append and apply balance deltas. Returns (added, skipped). dates=False
+        leaves the rows out of the date index: the caller, still holding lock, passes them
+        to ledger.add_dates() afterwards (one merge for many batches)."""
+        with self.lock:
+            added = []
+            skipped = 0
+            self._in_batch = True
+            try:
+                for tx in txs:
+                    if not self._is_valid(tx):
+                        skipped += 1
+                        continue
+                    if not tx.id:
+                        tx.id = utils.generate_uuid()
+                    elif self.index.has_transaction(tx.id):
+                        skipped += 1
+                        continue
+                    self.ledger.append(tx, dates=False)
+                    self._log(ChangeOp.Add, tx.id, tx)
+                    added.append(tx)
+            finally:
+                self._in_batch = False
+            if dates:
+                self.ledger.add_dates(added)
+            self._commit()
+            return added, skipped
+
+    @staticmethod
+    def _is_valid(tx: Transaction) -> bool:
+        if not isinstance(tx.type, TxType):
+            return False
+        # amounts are integer cents (money.py); bool is an int subclass but never an amount,
+        # and anything beyond int64 could not be journaled or saved
+        return isinstance(tx.amount, int) and not isinstance(tx.amount, bool) and money.in_range(tx.amount)
+
+    @classmethod
+    def _check(cls, tx: Transaction):
+        if not cls._is_valid(tx):
+            raise ValueError(f"invalid transaction: type={tx.type!r} amount={tx.amount!r}")
 
     def edit_transaction(self, tx_id: str, new_tx: Transaction) -> bool:
-        for i, t in enumerate(self.txs):
-            if t.id == tx_id:
-                self.txs[i] = new_tx
-                if not self.txs[i].id:
-                    self.txs[i].id = tx_id
-                self.recalculate_balances()
-                return True
-        return False
+        """new_tx should be a copy: editing the stored object in place forces full rebuilds.
+        Raises ValueError like add_transaction."""
+        self._check(new_tx)
+        with self.lock:
+            i = self.index.position(tx_id)
+            if i is None:
+                return False
+            if not new_tx.id:
+                new_tx.id = tx_id
+            self.ledger.replace(i, new_tx)
+            self._log(ChangeOp.Edit, tx_id, new_tx)
+            self._commit()
+            return True
 
     def delete_transaction(self, tx_id: str) -> bool:
-        orig_len = len(self.txs)
-        self.txs = [t for t in self.txs if t.id != tx_id]
-        if len(self.txs) != orig_len:
-            self.recalculate_balances()
+        with self.lock:
+            i = self.index.position(tx_id)
+            if i is None:
+                return False
+            self.ledger.delete(i)
+            self._log(ChangeOp.Delete, tx_id, None)
+            self._commit()
             return True
-        return False
+
+    def add_account(self, a: Account) -> Account:
+        with self.lock:
+            self.ledger.add_account(a)
+            self._log_entity(a)
+            return a
+
+    def add_category(self, c: Category) -> Category:
+        with self.lock:
+            self.ledger.add_category(c)
+            self._log_entity(c)
+            return c
+
+    def journal_entities(self, entities: Iterable):
+        """Journal accounts/categories already in the ledger lists that were created before
+        this service existed (the journal has nothing to replay them from otherwise)."""
+        if self.journal is None:
+            return
+        with self.lock:
+            for e in entities:
+                self.journal.append_entity(e)
+            self.journal.commit()
+
+    def _log_entity(self, entity):
+        # journaled like a change, so transactions that refer to it survive a crash;
+        # inside add_transactions() it goes into the batch's commit
+        if self.journal is not None:
+            self.journal.append_entity(entity)
+            if not self._in_batch:
+                self.journal.commit()
+
+    def _log(self, op: ChangeOp, tx_id: str, tx: Optional[Transaction]):
+        change = (op, tx_id, tx)
+        self.changes.append(change)
+        if self.journal is not None:
+            self.journal.append(change)
+
+    def _commit(self):
+        if self.journal is not None:
+            self.journal.commit()
+
+    def take_changes(self) -> List[Tuple[ChangeOp, str, Optional[Transaction]]]:
+        with self.lock:
+            changes, self.changes = self.changes, []
+            return changes
+
+    def snapshot(self) -> Tuple[List[Transaction], List[Account], List[Category],
+                                List[Tuple[ChangeOp, str, Optional[Transaction]]]]:
+        """Copies of txs/accounts/categories plus take_changes(), consistent with each
+        other, for saving on another thread. Transactions are shared: edits replace them."""
+        with self.lock:
+            accounts = [copy.copy(a) for a in self.accounts]
+            return list(self.txs), accounts, list(self.categories), self.take_changes()
 
     def get_transaction(self, tx_id: str) -> Optional[Transaction]:
-        for t in self.txs:
-            if t.id == tx_id:
-                return t
-        return None
+        return self.index.get_transaction(tx_id)
 
     def list_transactions(self) -> List[Transaction]:
         return list(self.txs)
@@ -51,43 +206,187 @@ class TransactionService:
     def search_by_category(self, category_id: str) -> List[Transaction]:
         return [t for t in self.txs if t.category_id == category_id]
 
+    @property
+    def search_index(self) -> SearchIndex:
+        if self._search is None:
+            self._search = self.ledger.subscribe(SearchIndex(self.txs))
+        return self._search
+
+    def search(self, text: str = "", account_id: Optional[str] = None, category_id: Optional[str] = None,
+               tx_type: Optional[TxType] = None, min_amount: Optional[money.Cents] = None,
+               max_amount: Optional[money.Cents] = None, limit: Optional[int] = None) -> List[Transaction]:
+        """Remark terms + account/category/type + inclusive amount range, all ANDed; see search.py."""
+        return self.search_index.search(text, account_id, category_id, tx_type, min_amount, max_amount, limit)
+
     def filter_by_date_range(self, start_iso: str, end_iso: str) -> List[Transaction]:
-        def between(dt):
-            if start_iso and dt < start_iso:
-                return False
-            if end_iso and dt > end_iso:
-                return False
-            return True
-        return [t for t in self.txs if between(t.datetime)]
+        return self.index.date_range(start_iso, end_iso)
 
-    def recalculate_balances(self):
-        # reset
+    def page(self, limit: int = 50, after: Optional[Cursor] = None, start_iso: str = "", end_iso: str = "",
+             descending: bool = False) -> Tuple[List[Transaction], Optional[Cursor]]:
+        """
+        One page of transactions in [start_iso, end_iso] ordered by (datetime, id), newest
+        first when descending. after is the cursor returned with the previous page; the
+        returned cursor is None on the last page. O(log n + limit) via the date index.
+        Keyset paging; the count in the cursor keeps rows with a repeated id apart.
+        """
+        index = self.index
+        i, j = index.date_bounds(start_iso, end_iso)
+        if descending:
+            if after is not None:
+                j = max(i, min(j, index.key_position(after[0], after[1]) - after[2]))
+            lo = max(i, j - limit)
+            rows = index.date_slice(lo, j)[::-1]
+            if lo > i and rows:
+                last = rows[-1]
+                return rows, (last.datetime, last.id, index.key_position(last.datetime, last.id) - lo)
+        else:
+            if after is not None:
+                i = min(j, max(i, index.key_position(after[0], after[1], after=False) + after[2]))
+            hi = min(j, i + limit)
+            rows = index.date_slice(i, hi)
+            if hi < j and rows:
+                last = rows[-1]
+                return rows, (last.datetime, last.id, hi - index.key_position(last.datetime, last.id, after=False))
+        return rows, None
+
+    def expected_balances(self) -> Dict[str, money.Cents]:
+        """Replay every transaction from initial_balance; O(n + m), does not modify accounts."""
+        return self.ledger.expected_balances()
+
+    def verify_balances(self, tolerance: money.Cents = 0) -> List[Dict]:
+        """Compare incrementally maintained balances with a full replay; returns the mismatches."""
+        expected = self.expected_balances()
+        out = []
         for a in self.accounts:
-            a.current_balance = float(a.initial_balance)
-        # apply sorted by datetime
-        sorted_tx = sorted(self.txs, key=lambda x: x.datetime)
-        for t in sorted_tx:
-            for a in self.accounts:
-                if a.id == t.account_id:
-                    if t.type == TxType.Income:
-                        a.current_balance += t.amount
-                    else:
-                        a.current_balance -= t.amount
+            if abs(a.current_balance - expected[a.id]) > tolerance:
+                out.append({"account_id": a.id, "current": a.current_balance, "expected": expected[a.id]})
+        return out
+
+    def recalculate_balances(self):
+        # full rebuild; only needed on load or to repair after verify_balances
+        self.ledger.recalculate_balances()
+
+    def balance_at(self, account_id: str, date_iso: str) -> Optional[money.Cents]:
+        """Balance of the account after date_iso (inclusive): nearest monthly checkpoint
+        plus the transactions since; None for an unknown account."""
+        # fills in checkpoints lazily, as does the autosave thread's to_dict()
+        with self.lock:
+            return self.checkpoints.balance_at(account_id, date_iso)
+
+
+class NameResolver:
+    """
+    Maps the category/account columns of imported rows to ids. Exports write names, so a
+    value is taken as an id if one exists, else looked up in the LedgerIndex reverse-name
+    maps (O(1) per row). Unknown names are created when auto_create is set (categories
+    get the row's type, also when the name only exists with the other type) and are
+    otherwise kept as they are and counted in unresolved.
+    """
+
+    def __init__(self, tx_service: "TransactionService", auto_create: bool = False):
+        self.tx_service = tx_service
+        self.index = tx_service.index
+        self.auto_create = auto_create
+        self.created_accounts: List[Account] = []
+        self.created_categories: List[Category] = []
+        self.unresolved = 0
+
+    def resolve(self, tx: Transaction) -> Transaction:
+        index = self.index
+        if index.account(tx.account_id) is None:
+            a = index.account_by_name(tx.account_id)
+            if a is None and self.auto_create and tx.account_id:
+                a = Account(id=utils.generate_uuid(), name=tx.account_id)
+                self.tx_service.add_account(a)
+                self.created_accounts.append(a)
+            if a is not None:
+                tx.account_id = a.id
+            else:
+                self.unresolved += 1
+        if index.category(tx.category_id) is None:
+            c = index.category_by_name(tx.category_id, tx.type)
+            if self.auto_create and tx.category_id and (c is None or c.type != tx.type):
+                c = Category(id=utils.generate_uuid(), name=tx.category_id, type=tx.type)
+                self.tx_service.add_category(c)
+                self.created_categories.append(c)
+            if c is not None:
+                tx.category_id = c.id
+            else:
+                self.unresolved += 1
+        return tx
+
+    def resolve_all(self, txs: Iterable[Transaction]) -> Iterator[Transaction]:
+        for tx in txs:
+            yield self.resolve(tx)
 
 
 class StatisticsService:
-    def __init__(self, txs: List[Transaction], categories: List[Category]):
-        self.txs = txs
-        self.categories = categories
-
-    def calculate_totals(self, start_iso: str = "", end_iso: str = "") -> Tuple[float, float]:
-        inc = 0.0
-        exp = 0.0
-        for t in self.txs:
-            if start_iso and t.datetime < start_iso:
-                continue
-            if end_iso and t.datetime > end_iso:
-                continue
+    def __init__(self, ledger: Ledger, rollups: Optional[RollupStore] = None,
+                 columnar: Optional[ColumnarStore] = None, sql=None, cache_size: int = STATS_CACHE_SIZE):
+        # the same Ledger as TransactionService, so queries always see the current data;
+        # pass its .rollups / .columnar too, they are kept in sync by the ledger
+        self.ledger = ledger
+        self.rollups = rollups
+        self.columnar = columnar
+        # SQLiteStorage: aggregates run as SQL over the database instead of in memory
+        self.sql = sql
+        # memoized results for one ledger version, least recently used evicted first
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, object]" = OrderedDict()
+        self._cache_version = ledger.version
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def txs(self) -> List[Transaction]:
+        return self.ledger.txs
+
+    @property
+    def categories(self) -> List[Category]:
+        return self.ledger.categories
+
+    @property
+    def index(self) -> LedgerIndex:
+        return self.ledger.index
+
+    def _memo(self, key: Tuple, compute: Callable[[], object]):
+        if self._cache_version != self.ledger.version:
+            # any mutation may change any result
+            self._cache.clear()
+            self._cache_version = self.ledger.version
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        self.misses += 1
+        value = compute()
+        if self.cache_size > 0:
+            self._cache[key] = value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def cache_info(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.cache_size}
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def calculate_totals(self, start_iso: str = "", end_iso: str = "") -> Tuple[money.Cents, money.Cents]:
+        return self._memo(("totals", start_iso, end_iso), lambda: self._totals(start_iso, end_iso))
+
+    def _totals(self, start_iso: str, end_iso: str) -> Tuple[money.Cents, money.Cents]:
+        if self.sql is not None:
+            return self.sql.totals(start_iso, end_iso)
+        if self.columnar is not None:
+            res = self.columnar.totals(start_iso, end_iso)
+            if res is not None:
+                return res
+        if self.rollups is not None:
+            return self.rollups.totals(start_iso, end_iso)
+        inc = 0
+        exp = 0
+        for t in self.index.date_range(start_iso, end_iso):
             if t.type == TxType.Income:
                 inc += t.amount
             else:
@@ -95,72 +394,194 @@ class StatisticsService:
         return inc, exp
 
     def top_categories(self, tx_type: TxType, top_n: int = 10, start_iso: str = "", end_iso: str = "") -> List[Dict]:
-        sums = {}
-        for t in self.txs:
-            if t.type != tx_type:
-                continue
-            if start_iso and t.datetime < start_iso:
-                continue
-            if end_iso and t.datetime > end_iso:
-                continue
-            sums[t.category_id] = sums.get(t.category_id, 0.0) + t.amount
-        items = sorted(sums.items(), key=lambda x: x[1], reverse=True)
+        # the ranking is cached without top_n, so any top_n is served from one entry
+        items = self._memo(("categories", tx_type, start_iso, end_iso),
+                           lambda: self._category_ranking(tx_type, start_iso, end_iso))
         out = []
         for cid, total in items[:top_n]:
-            name = cid
-            for c in self.categories:
-                if c.id == cid:
-                    name = c.name
-                    break
-            out.append({"category_id": cid, "category_name": name, "total": total})
+            out.append({"category_id": cid, "category_name": self.index.category_name(cid), "total": total})
         return out
 
+    def _category_ranking(self, tx_type: TxType, start_iso: str, end_iso: str) -> List[Tuple[str, money.Cents]]:
+        sums = None
+        if self.sql is not None:
+            sums = self.sql.category_totals(tx_type, start_iso, end_iso)
+        if sums is None and self.columnar is not None:
+            sums = self.columnar.category_totals(tx_type, start_iso, end_iso)
+        if sums is None and self.rollups is not None:
+            sums = self.rollups.category_totals(tx_type, start_iso, end_iso)
+        if sums is None:
+            sums = {}
+            for t in self.index.date_range(start_iso, end_iso):
+                if t.type != tx_type:
+                    continue
+                sums[t.category_id] = sums.get(t.category_id, 0) + t.amount
+        return sorted(sums.items(), key=lambda x: x[1], reverse=True)
+
 
 class ExportService:
     @staticmethod
-    def export_transactions_to_csv(txs: List[Transaction], cats: List[Category], accts: List[Account], path: str) -> bool:
-        rows = []
+    def iter_export_rows(txs: Iterable[Transaction], cats: List[Category], accts: List[Account],
+                         index: Optional[LedgerIndex] = None) -> Iterator[Dict]:
+        index = index or LedgerIndex([], accts, cats)
         for t in txs:
-            catname = t.category_id
-            for c in cats:
-                if c.id == t.category_id:
-                    catname = c.name
-                    break
-            acctname = t.account_id
-            for a in accts:
-                if a.id == t.account_id:
-                    acctname = a.name
-                    break
-            rows.append({
+            yield {
                 "id": t.id,
                 "type": t.type.value,
-                "amount": t.amount,
-                "category": catname,
-                "account": acctname,
+                "amount": money.format_cents(t.amount),
+                "category": index.category_name(t.category_id),
+                "account": index.account_name(t.account_id),
                 "datetime": t.datetime,
                 "remark": t.remark,
                 "receipt": t.receipt_path
-            })
+            }
+
+    @staticmethod
+    def export_transactions_to_csv(txs: Iterable[Transaction], cats: List[Category], accts: List[Account], path: str,
+                                   chunk_size: int = utils.CSV_CHUNK_SIZE,
+                                   progress: Optional[Callable[[int], None]] = None,
+                                   index: Optional[LedgerIndex] = None) -> bool:
+        rows = ExportService.iter_export_rows(txs, cats, accts, index)
         try:
-            utils.write_transactions_csv(path, rows)
+            utils.write_transactions_csv(path, rows, chunk_size, progress)
             return True
         except Exception:
             return False
 
+    @staticmethod
+    def parse_csv_row(row: Dict) -> Transaction:
+        return Transaction(
+            id=row.get("id") or utils.generate_uuid(),
+            type=TxType(row.get("type") or TxType.Expense.value),
+            amount=money.parse(row.get("amount") or "0"),
+            category_id=intern_id(row.get("category") or ""),
+            account_id=intern_id(row.get("account") or ""),
+            datetime=row.get("datetime") or utils.current_datetime_iso(),
+            remark=row.get("remark") or "",
+            receipt_path=row.get("receipt") or ""
+        )
+
+    @staticmethod
+    def iter_transactions_from_csv(path: str) -> Iterator[Transaction]:
+        for row in utils.iter_transactions_csv(path):
+            yield ExportService.parse_csv_row(row)
+
     @staticmethod
     def import_transactions_from_csv(path: str) -> List[Transaction]:
-        data = utils.read_transactions_csv(path)
-        out = []
-        for row in data:
-            t = Transaction(
-                id=row.get("id") or utils.generate_uuid(),
-                type=TxType(row.get("type") or TxType.Expense.value),
-                amount=float(row.get("amount") or 0.0),
-                category_id=row.get("category") or "",
-                account_id=row.get("account") or "",
-                datetime=row.get("datetime") or utils.current_datetime_iso(),
-                remark=row.get("remark") or "",
-                receipt_path=row.get("receipt") or ""
-            )
-            out.append(t)
-        return out
\ No newline at end of file
+        return list(ExportService.iter_transactions_from_csv(path))
+
+    @staticmethod
+    def import_csv_into(tx_service: TransactionService, path: str, chunk_size: int = utils.CSV_CHUNK_SIZE,
+                        progress: Optional[Callable[[int], None]] = None,
+                        resolver: Optional[NameResolver] = None) -> Dict:
+        """Stream path into tx_service chunk by chunk; memory is bounded by chunk_size.
+        Category/account names are mapped to ids by resolver (a default NameResolver if
+        None; pass one to auto-create or to read its counters afterwards). Rows that fail
+        to parse are reported and skipped. progress(rows_read) is called after each chunk.
+        Returns a report like those of import_files_into."""
+        resolver = resolver or NameResolver(tx_service)
+        start = time.perf_counter()
+        report = _new_report(path)
+        unresolved = resolver.unresolved
+        added = skipped = 0
+        undated: List[Transaction] = []
+        # the chunks are date-indexed together at the end (merging each one costs a pass
+        # over the whole index); the lock is held so nobody sees the index in between
+        with tx_service.lock:
+            try:
+                for chunk in utils.chunked(_parse_rows(path, report), chunk_size):
+                    a, s = tx_service.add_transactions(resolver.resolve_all(chunk), dates=False)
+                    undated += a
+                    added += len(a)
+                    skipped += s
+                    if progress:
+                        progress(report["rows"])
+            finally:
+                tx_service.ledger.add_dates(undated)
+        _timed(report, start)
+        report["added"] = added
+        report["skipped"] = skipped
+        report["unresolved"] = resolver.unresolved - unresolved
+        return report
+
+    @staticmethod
+    def import_files_into(tx_service: TransactionService, paths: List[str], workers: Optional[int] = None,
+                          progress: Optional[Callable[[Dict], None]] = None,
+                          resolver: Optional[NameResolver] = None) -> List[Dict]:
+        """
+        Parse several CSV files in a process pool, then add them to tx_service in the
+        order of paths (row order within a file), so the result does not depend on which
+        worker finishes first; ids already present or repeated are skipped. Rows that fail
+        to parse are reported, not added. Returns one report per file: path, rows, added,
+        skipped (duplicate or invalid), errors (first MAX_REPORTED_ERRORS), error_count,
+        seconds (parsing and adding), rows_per_sec and unresolved (names left as they were,
+        see NameResolver). progress(report) is called as each file is merged.
+        """
+        resolver = resolver or NameResolver(tx_service)
+        if len(paths) == 1:
+            # nothing to run in parallel: stream it with bounded memory instead
+            report = ExportService.import_csv_into(tx_service, paths[0], resolver=resolver)
+            if progress:
+                progress(report)
+            return [report]
+        if workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_parse_csv_file, paths))
+        else:
+            results = [_parse_csv_file(p) for p in paths]
+        reports = []
+        for path, (payload, report) in zip(paths, results):
+            start = time.perf_counter() - report["seconds"]
+            unresolved = resolver.unresolved
+            txs = binfmt.Reader(payload).transactions()
+            added, skipped = tx_service.add_transactions(resolver.resolve_all(txs))
+            _timed(report, start)
+            report["added"] = len(added)
+            report["skipped"] = skipped
+            report["unresolved"] = resolver.unresolved - unresolved
+            reports.append(report)
+            if progress:
+                progress(report)
+        return reports
+
+
+def _new_report(path: str) -> Dict:
+    return {"path": path, "rows": 0, "errors": [], "error_count": 0}
+
+
+def _report_error(report: Dict, message: str):
+    report["error_count"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append(message)
+
+
+def _timed(report: Dict, start: float):
+    seconds = time.perf_counter() - start
+    report["seconds"] = seconds
+    report["rows_per_sec"] = report["rows"] / seconds if seconds > 0 else 0.0
+
+
+def _parse_rows(path: str, report: Dict) -> Iterator[Transaction]:
+    # rows that fail to parse, or a file that cannot be read, end up in report instead of raising
+    try:
+        for n, row in enumerate(utils.iter_transactions_csv(path), 1):
+            report["rows"] = n
+            try:
+                tx = ExportService.parse_csv_row(row)
+            except (ValueError, TypeError) as e:
+                _report_error(report, f"row {n}: {e}")
+                continue
+            yield tx
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        _report_error(report, f"file: {e}")
+
+
+def _parse_csv_file(path: str) -> Tuple[bytes, Dict]:
+    # process pool worker: returns the parsed rows binfmt-encoded (much cheaper to send
+    # back than pickled objects) plus the file report
+    start = time.perf_counter()
+    report = _new_report(path)
+    w = binfmt.Writer()
+    w.transactions(list(_parse_rows(path, report)))
+    _timed(report, start)
+    return w.getvalue(), report
@@ -0,0 +1,370 @@
+"""
+sqlite_storage.py - SQLite 存储后端：字段级加密 + 索引，统计与区间查询可下推到 SQL
+Columns needed for filtering and aggregation (type, amount, category_id, account_id,
+datetime) are stored in clear and indexed. Free text (remarks, receipt paths, account and
+category names/icons) and the applock are sealed per field with AES-GCM; the AAD binds
+each value to its table, column and row id, so values cannot be swapped between rows.
+The key comes from PBKDF2 with the salt kept in the meta table, like the FA1 file.
+Transaction order (and duplicate ids) are kept through the integer seq column. Money is
+stored as integer cents (money.py); schema 1 databases with REAL amounts are converted on open.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Optional, Dict, Tuple, Iterator, Union
+from .models import Transaction, Account, Category, AppLock, TxType, ChangeOp, intern_id
+from .storage import StorageBackend, LazyTransactions
+from . import encryption, segments, money
+
+_CHECK = "FinanceApp"
+SCHEMA_VERSION = 2
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS accounts (
+    pos INTEGER PRIMARY KEY, id TEXT, name BLOB, icon BLOB,
+    initial_balance INTEGER, current_balance INTEGER);
+CREATE TABLE IF NOT EXISTS categories (
+    pos INTEGER PRIMARY KEY, id TEXT, name BLOB, icon BLOB, color TEXT, type TEXT);
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY, id TEXT, type TEXT, amount INTEGER, category_id TEXT,
+    account_id TEXT, datetime TEXT, remark BLOB, receipt_path BLOB);
+CREATE INDEX IF NOT EXISTS tx_id ON transactions (id);
+CREATE INDEX IF NOT EXISTS tx_datetime ON transactions (datetime);
+CREATE INDEX IF NOT EXISTS tx_category ON transactions (category_id, datetime);
+CREATE INDEX IF NOT EXISTS tx_account ON transactions (account_id, datetime);
+"""
+_TX_COLUMNS = "id, type, amount, category_id, account_id, datetime, remark, receipt_path"
+_INDEXES = ("tx_id", "tx_datetime", "tx_category", "tx_account")
+
+
+def _range_sql(start_iso: str, end_iso: str) -> Tuple[str, list]:
+    # same string semantics as the in-memory path: start <= datetime <= end, empty = unbounded
+    where, args = [], []
+    if start_iso:
+        where.append("datetime >= ?")
+        args.append(start_iso)
+    if end_iso:
+        where.append("datetime <= ?")
+        args.append(end_iso)
+    return (" WHERE " + " AND ".join(where)) if where else "", args
+
+
+class _WriteThrough:
+    """TransactionService journal that applies each commit to the database directly,
+    so SQL queries always see the in-memory state."""
+
+    def __init__(self, store: "SQLiteStorage"):
+        self.store = store
+        self.ready = False
+        self.pending: List[segments.Change] = []
+        self.entities: List[Union[Account, Category]] = []
+        self.applied = 0  # ops written since the last save()
+
+    def append(self, change: segments.Change):
+        if self.ready:
+            self.pending.append(change)
+
+    def append_entity(self, entity: Union[Account, Category]):
+        if self.ready:
+            self.entities.append(entity)
+
+    def commit(self):
+        # save() may run on the autosave thread meanwhile: take the ops and count them
+        # under the store lock, so each is applied exactly once and save() sees applied
+        # consistent with the rows
+        with self.store.lock:
+            changes, self.pending = self.pending, []
+            entities, self.entities = self.entities, []
+            if not (changes or entities):
+                return
+            with self.store.conn:
+                if not self.applied:
+                    # account balances in the database lag until the next save()
+                    self.store.conn.execute("INSERT OR REPLACE INTO meta VALUES ('dirty', 1)")
+                self.store._insert_accounts([e for e in entities if isinstance(e, Account)])
+                self.store._insert_categories([e for e in entities if isinstance(e, Category)])
+                self.store._apply_changes(changes)
+            self.applied += len(changes)
+
+    def sync(self):
+        pass
+
+    def close(self):
+        self.commit()
+
+
+class SQLiteStorage(StorageBackend):
+    pushdown = True
+
+    def __init__(self, path: str, password: str = ""):
+        self.path = path
+        # only the KeySession keeps the password, in a buffer clear() overwrites
+        self.keys = encryption.KeySession(password)
+        # shared with the autosave thread; every use of conn goes through self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        existing = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'meta'").fetchone()
+        if existing and not self.conn.execute("SELECT 1 FROM meta WHERE key = 'schema'").fetchone():
+            self._upgrade_v1()
+        self.conn.executescript(_SCHEMA)
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO meta VALUES ('schema', ?)", (SCHEMA_VERSION,))
+        self.salt = self._init_salt()
+        self.journal = _WriteThrough(self)
+
+    def _upgrade_v1(self):
+        # schema 1 kept money in REAL columns, which would turn cents back into floats:
+        # recreate the two tables and convert with money.from_float, all in one transaction
+        c = self.conn
+        c.create_function("cents", 1, money.from_float, deterministic=True)
+        c.execute("BEGIN")
+        try:
+            for name in _INDEXES:
+                c.execute(f"DROP INDEX IF EXISTS {name}")
+            c.execute("ALTER TABLE accounts RENAME TO accounts_v1")
+            c.execute("ALTER TABLE transactions RENAME TO transactions_v1")
+            for stmt in _SCHEMA.split(";"):
+                if stmt.strip():
+                    c.execute(stmt)
+            c.execute("INSERT INTO accounts SELECT pos, id, name, icon, cents(initial_balance), "
+                      "cents(current_balance) FROM accounts_v1")
+            c.execute("INSERT INTO transactions SELECT seq, id, type, cents(amount), category_id, account_id, "
+                      "datetime, remark, receipt_path FROM transactions_v1")
+            c.execute("DROP TABLE accounts_v1")
+            c.execute("DROP TABLE transactions_v1")
+            c.execute("INSERT INTO meta VALUES ('schema', ?)", (SCHEMA_VERSION,))
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+
+    # --- field encryption ---
+
+    def _init_salt(self) -> bytes:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'salt'").fetchone()
+        if row:
+            return row[0]
+        salt = os.urandom(encryption.SALT_SIZE)
+        with self.conn:
+            self.conn.execute("INSERT INTO meta VALUES ('salt', ?)", (salt,))
+        return salt
+
+    def _seal(self, value: str, aad: str) -> Optional[bytes]:
+        if not value:
+            return None
+        return self.keys.seal(self.salt, value.encode("utf-8"), aad.encode("utf-8"))
+
+    def _open(self, blob: Optional[bytes], aad: str) -> str:
+        if not blob:
+            return ""
+        n = encryption.NONCE_SIZE
+        return self.keys.aead(self.salt).decrypt(blob[:n], blob[n:], aad.encode("utf-8")).decode("utf-8")
+
+    def _rekey(self):
+        self.salt = os.urandom(encryption.SALT_SIZE)
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('salt', ?)", (self.salt,))
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('check', ?)", (self._seal(_CHECK, "meta.check"),))
+
+    def _verify_password(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'check'").fetchone()
+        if row is None:
+            with self.conn:
+                self.conn.execute("INSERT INTO meta VALUES ('check', ?)", (self._seal(_CHECK, "meta.check"),))
+            return
+        try:
+            self._open(row[0], "meta.check")
+        except Exception as e:
+            raise RuntimeError(f"Decrypt failed: {e!r}")
+
+    # --- rows ---
+
+    def _tx_row(self, t: Transaction) -> tuple:
+        return (t.id, t.type.value, t.amount, t.category_id, t.account_id, t.datetime,
+                self._seal(t.remark, "tx.remark:" + t.id), self._seal(t.receipt_path, "tx.receipt:" + t.id))
+
+    def _tx_from_row(self, r) -> Transaction:
+        tid = r[0]
+        return Transaction(tid, TxType(r[1]), r[2], intern_id(r[3]), intern_id(r[4]), r[5],
+                           self._open(r[6], "tx.remark:" + tid), self._open(r[7], "tx.receipt:" + tid))
+
+    def _apply_changes(self, changes: List[segments.Change]):
+        # edit/delete target the first row with the id, like TransactionService
+        first = "(SELECT MIN(seq) FROM transactions WHERE id = ?)"
+        for op, tx_id, tx in changes:
+            if op == ChangeOp.Add:
+                self.conn.execute(f"INSERT INTO transactions ({_TX_COLUMNS}) VALUES (?,?,?,?,?,?,?,?)",
+                                  self._tx_row(tx))
+            elif op == ChangeOp.Edit:
+                self.conn.execute(
+                    "UPDATE transactions SET id=?, type=?, amount=?, category_id=?, account_id=?, datetime=?, "
+                    f"remark=?, receipt_path=? WHERE seq = {first}", self._tx_row(tx) + (tx_id,))
+            else:
+                self.conn.execute(f"DELETE FROM transactions WHERE seq = {first}", (tx_id,))
+
+    def _write_meta(self, accts: List[Account], cats: List[Category], applock: AppLock):
+        c = self.conn
+        c.execute("DELETE FROM accounts")
+        self._insert_accounts(accts)
+        c.execute("DELETE FROM categories")
+        self._insert_categories(cats)
+        sealed = self._seal(json.dumps(applock.to_dict()), "meta.applock")
+        c.execute("INSERT OR REPLACE INTO meta VALUES ('applock', ?)", (sealed,))
+
+    def _insert_accounts(self, accts: List[Account]):
+        self.conn.executemany("INSERT INTO accounts (id, name, icon, initial_balance, current_balance) VALUES (?,?,?,?,?)", [
+            (a.id, self._seal(a.name, "account.name:" + a.id), self._seal(a.icon, "account.icon:" + a.id),
+             a.initial_balance, a.current_balance) for a in accts])
+
+    def _insert_categories(self, cats: List[Category]):
+        self.conn.executemany("INSERT INTO categories (id, name, icon, color, type) VALUES (?,?,?,?,?)", [
+            (x.id, self._seal(x.name, "category.name:" + x.id), self._seal(x.icon, "category.icon:" + x.id),
+             x.color, x.type.value) for x in cats])
+
+    # --- StorageBackend ---
+
+    def load_meta(self) -> Tuple[List[Account], List[Category], AppLock]:
+        """Accounts, categories and applock only; transactions stay in the database."""
+        self._verify_password()
+        accts = [Account(intern_id(r[0]), self._open(r[1], "account.name:" + r[0]),
+                         self._open(r[2], "account.icon:" + r[0]), r[3], r[4])
+                 for r in self.conn.execute(
+                     "SELECT id, name, icon, initial_balance, current_balance FROM accounts ORDER BY pos")]
+        cats = [Category(intern_id(r[0]), self._open(r[1], "category.name:" + r[0]),
+                         self._open(r[2], "category.icon:" + r[0]), r[3], TxType(r[4]))
+                for r in self.conn.execute("SELECT id, name, icon, color, type FROM categories ORDER BY pos")]
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'applock'").fetchone()
+        applock = AppLock.from_dict(json.loads(self._open(row[0], "meta.applock"))) if row and row[0] else AppLock()
+        self.journal.ready = True
+        return accts, cats, applock
+
+    def load(self) -> Tuple[List[Transaction], List[Account], List[Category], AppLock]:
+        accts, cats, applock = self.load_meta()
+        return list(self.iter_transactions()), accts, cats, applock
+
+    def save(self, txs: List[Transaction], accts: List[Account], cats: List[Category], applock: AppLock,
+             changes: Optional[List[segments.Change]] = None, checkpoint: bool = True) -> bool:
+        """changes: TransactionService.take_changes(); the prefix already written through
+        the journal is skipped. None rewrites every transaction row. Written-through rows
+        are durable already, so checkpoint makes no difference here. Does not commit the
+        journal: every mutation commits itself under the service lock."""
+        with self.lock, self.conn:
+            if changes is None or not self.journal.ready or self.keys.exhausted(self.salt):
+                # full rewrite; also re-keys the database, e.g. after a failed load or
+                # once the current key sealed too many values
+                self._rekey()
+                self.conn.execute("DELETE FROM transactions")
+                self.conn.executemany(f"INSERT INTO transactions ({_TX_COLUMNS}) VALUES (?,?,?,?,?,?,?,?)",
+                                      (self._tx_row(t) for t in txs))
+            else:
+                self._apply_changes(changes[self.journal.applied:])
+            self._write_meta(accts, cats, applock)
+            # ops written through after changes was taken belong to the next save
+            applied = max(0, self.journal.applied - len(changes or []))
+            if not applied:
+                self.conn.execute("DELETE FROM meta WHERE key = 'dirty'")
+            # derived data describes the previous state; the caller writes it again
+            self.conn.execute("DELETE FROM meta WHERE key LIKE 'extra:%'")
+            self.journal.applied = applied
+            self.journal.ready = True
+        return True
+
+    def open_lazy(self) -> Tuple[LazyTransactions, List[Account], List[Category], AppLock]:
+        accts, cats, applock = self.load_meta()
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'dirty'").fetchone():
+            # rows were written through after the last save: refresh balances with one aggregate
+            balances = self.account_balances()
+            for a in accts:
+                a.current_balance = balances[a.id]
+        return LazyTransactions(lambda: list(self.iter_transactions()), self.query_range), accts, cats, applock
+
+    def save_meta(self, accts: List[Account], cats: List[Category], applock: AppLock) -> bool:
+        if not self.journal.ready:  # not opened with this password
+            return False
+        with self.lock, self.conn:
+            self._write_meta(accts, cats, applock)
+            self.conn.execute("DELETE FROM meta WHERE key = 'dirty'")
+        return True
+
+    def save_extra(self, name: str, data: Dict) -> bool:
+        if not self.journal.ready:
+            return False
+        sealed = self._seal(json.dumps(data, separators=(",", ":")), "meta.extra:" + name)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", ("extra:" + name, sealed))
+        return True
+
+    def load_extra(self, name: str) -> Optional[Dict]:
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'dirty'").fetchone():
+                # rows were written through after it was stored
+                return None
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", ("extra:" + name,)).fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(self._open(row[0], "meta.extra:" + name))
+        except Exception:
+            return None
+
+    def backup(self, backup_path: str) -> bool:
+        try:
+            dest = sqlite3.connect(backup_path)
+            try:
+                with self.lock:
+                    self.conn.backup(dest)
+            finally:
+                dest.close()
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        self.journal.close()
+        self.conn.close()
+        self.keys.clear()
+
+    # --- queries pushed down to SQL ---
+
+    def iter_transactions(self) -> Iterator[Transaction]:
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {_TX_COLUMNS} FROM transactions ORDER BY seq").fetchall()
+        for r in rows:
+            yield self._tx_from_row(r)
+
+    def query_range(self, start_iso: str = "", end_iso: str = "") -> List[Transaction]:
+        """Like LedgerIndex.date_range: ordered by (datetime, id), served by the datetime index."""
+        where, args = _range_sql(start_iso, end_iso)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {_TX_COLUMNS} FROM transactions{where} ORDER BY datetime, id",
+                                     args).fetchall()
+        return [self._tx_from_row(r) for r in rows]
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def totals(self, start_iso: str = "", end_iso: str = "") -> Tuple[int, int]:
+        where, args = _range_sql(start_iso, end_iso)
+        with self.lock:
+            sums = dict(self.conn.execute(f"SELECT type, SUM(amount) FROM transactions{where} GROUP BY type", args))
+        return sums.get(TxType.Income.value, 0), sums.get(TxType.Expense.value, 0)
+
+    def category_totals(self, tx_type: TxType, start_iso: str = "", end_iso: str = "") -> Dict[str, int]:
+        where, args = _range_sql(start_iso, end_iso)
+        where = (where + " AND" if where else " WHERE") + " type = ?"
+        with self.lock:
+            return dict(self.conn.execute(f"SELECT category_id, SUM(amount) FROM transactions{where} "
+                                          "GROUP BY category_id", args + [tx_type.value]))
+
+    def account_balances(self) -> Dict[str, int]:
+        """initial_balance plus the signed sum of each account's transactions."""
+        with self.lock:
+            out = dict(self.conn.execute("SELECT id, initial_balance FROM accounts").fetchall())
+            deltas = self.conn.execute(
+                "SELECT account_id, SUM(CASE type WHEN 'income' THEN amount ELSE -amount END) "
+                "FROM transactions GROUP BY account_id").fetchall()
+        for aid, delta in deltas:
+            if aid in out:
+                out[aid] += delta
+        return out
@@ -1,32 +1,249 @@
 """
-storage.py - 本地加密存储：序列化 JSON -> encrypt -> write file
-Load: read file -> decrypt -> parse JSON
+storage.py - 本地加密存储：序列化 (JSON 或二进制 binfmt) -> encrypt -> write file
+Load: read file -> decrypt -> 按明文 magic 自动识别格式 -> parse
+分段格式 (segments.py) 下，保存只追加自上次保存以来的变更段。
+两次保存之间的交易变更写入预写日志 (journal.py)，加载时重放；保存即检查点，之后清空日志。
 """
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Callable, Dict
 import json
 import os
 from .models import Transaction, Account, Category, AppLock, DataBundle
-from . import encryption, utils
+from . import encryption, utils, binfmt, segments, journal
 
 
 DEFAULT_DATA_FILE = "data.enc"
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+FORMAT_SEGMENTED = "segmented"
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
 
 
-class LocalStorage:
-    def __init__(self, path: str = DEFAULT_DATA_FILE, password: str = ""):
+class StorageBackend:
+    """
+    Interface shared by the storage backends. journal is the object TransactionService
+    reports mutations to (append/commit); it is usable once journal.ready is True.
+    """
+    path: str
+    journal = None
+    pushdown = False  # True if totals()/category_totals()/query_range() run in the backend
+
+    def load(self) -> Tuple[List[Transaction], List[Account], List[Category], AppLock]:
+        raise NotImplementedError
+
+    def save(self, txs: List[Transaction], accts: List[Account], cats: List[Category], applock: AppLock,
+             changes: Optional[List[segments.Change]] = None, checkpoint: bool = True) -> bool:
+        """checkpoint=False writes the data but leaves the journal alone until
+        finish_checkpoint(), so a save can run while other threads keep mutating; it must
+        follow begin_checkpoint()."""
+        raise NotImplementedError
+
+    def begin_checkpoint(self):
+        """Called under the service lock together with taking the snapshot that
+        save(checkpoint=False) will write: mutations from here on must survive a crash
+        whether or not that save reaches the disk."""
+        pass
+
+    def finish_checkpoint(self, changes_since: List[segments.Change]):
+        """After save(checkpoint=False): the data written holds everything but
+        changes_since (mutations made while it was being written)."""
+        pass
+
+    def backup(self, backup_path: str) -> bool:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def open_lazy(self) -> Tuple["LazyTransactions", List[Account], List[Category], AppLock]:
+        """Like load(), but transactions may be materialized later; backends that cannot
+        defer them load everything here."""
+        txs, accts, cats, applock = self.load()
+        return LazyTransactions(lambda: txs, balances_current=False), accts, cats, applock
+
+    def save_meta(self, accts: List[Account], cats: List[Category], applock: AppLock) -> bool:
+        """Persist accounts, categories and applock while the transactions are still
+        unloaded. False if the backend cannot; the caller then materializes and save()s."""
+        return False
+
+    def save_extra(self, name: str, data: Dict) -> bool:
+        """Persist derived data (e.g. balance checkpoints) computed from exactly what the
+        last save wrote. False if the backend cannot keep it."""
+        return False
+
+    def load_extra(self, name: str) -> Optional[Dict]:
+        """What save_extra(name) stored, or None if missing or the data changed since."""
+        return None
+
+
+def _in_range(t: Transaction, start_iso: str, end_iso: str) -> bool:
+    return (not start_iso or t.datetime >= start_iso) and (not end_iso or t.datetime <= end_iso)
+
+
+class LazyTransactions:
+    """
+    Transactions of an opened data file, materialized on demand. range() answers a date
+    query from the backend when it can (only the overlapping segments, or SQL) and from
+    the full list otherwise. balances_current tells whether the persisted account
+    balances already include every transaction (False after a journal replay).
+    """
+
+    def __init__(self, load_all: Callable[[], List[Transaction]],
+                 load_range: Optional[Callable[[str, str], Optional[List[Transaction]]]] = None,
+                 balances_current: bool = True):
+        self._load_all = load_all
+        self._load_range = load_range
+        self.balances_current = balances_current
+        self.txs: Optional[List[Transaction]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.txs is not None
+
+    def materialize(self) -> List[Transaction]:
+        if self.txs is None:
+            self.txs = self._load_all()
+            # the loaders hold the raw file; range() answers from self.txs from now on
+            self._load_all = self._load_range = None
+        return self.txs
+
+    def range(self, start_iso: str = "", end_iso: str = "") -> List[Transaction]:
+        """Transactions in [start_iso, end_iso] ordered by (datetime, id)."""
+        if self.txs is None and self._load_range is not None:
+            res = self._load_range(start_iso, end_iso)
+            if res is not None:
+                return res
+        res = [t for t in self.materialize() if _in_range(t, start_iso, end_iso)]
+        res.sort(key=lambda t: (t.datetime, t.id))
+        return res
+
+
+def open_storage(path: str = DEFAULT_DATA_FILE, password: str = "", fmt: str = FORMAT_JSON) -> StorageBackend:
+    """SQLite for *.db / *.sqlite paths, the encrypted file otherwise."""
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        from .sqlite_storage import SQLiteStorage
+        return SQLiteStorage(path, password)
+    return LocalStorage(path, password, fmt)
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, path: str = DEFAULT_DATA_FILE, password: str = "", fmt: str = FORMAT_JSON):
+        if fmt not in (FORMAT_JSON, FORMAT_BINARY, FORMAT_SEGMENTED):
+            raise ValueError(f"Unknown storage format: {fmt}")
         self.path = path
-        self.password = password or ""
+        # format used by save(); load() detects the format of whatever is on disk,
+        # so switching fmt migrates an existing JSON file on the next save
+        self.fmt = fmt
+        # derives the key once per salt and reuses it for every later save; the only
+        # holder of the password, in a buffer clear() overwrites
+        self.keys = encryption.KeySession(password)
+        self.segfile = segments.SegmentedFile(path, self.keys)
+        # write-ahead journal of mutations since the last save; enabled by a successful load()
+        self.journal = journal.Journal(path + ".wal", self.keys)
+        self.token = bytes(journal.TOKEN_SIZE)  # identifies the checkpoint on disk
+        self._next_token: Optional[bytes] = None  # from begin_checkpoint(), used once by save()
+        self._pending_token = self.token  # written by save(checkpoint=False), not yet the journal's base
+        self._replayed = False  # the journal added changes on top of the data file at load
         # when file exists, the salt is embedded in file; password must match to decrypt.
 
     def load(self) -> Tuple[List[Transaction], List[Account], List[Category], AppLock]:
+        txs, accts, cats, applock = self._load_checkpoint()
+        batches = self.journal.recover(self.token)
+        self._replayed = bool(batches)
+        if batches:
+            txs = journal.replay(txs, batches)
+            journal.replay_entities(accts, cats, batches)
+            # the replayed ops never reach TransactionService.changes: appending only
+            # the next delta would drop them, so the next save rewrites everything
+            self.segfile.synced = False
+        return txs, accts, cats, applock
+
+    def open_lazy(self) -> Tuple[LazyTransactions, List[Account], List[Category], AppLock]:
+        """A segmented file only has its manifest decrypted here; date queries then read
+        just the segments whose [min_dt, max_dt] overlaps them."""
+        self.token = bytes(journal.TOKEN_SIZE)
+        raw = utils.read_bytes(self.path) if utils.file_exists(self.path) else b""
+        if not segments.is_segmented(raw):
+            return super().open_lazy()
+        try:
+            accts, cats, applock = self.segfile.open(raw)
+        except Exception as e:
+            raise RuntimeError(f"Decrypt failed: {e}")
+        self.token = self.segfile.token
+        entries = list(self.segfile.segments)
+        batches = self.journal.recover(self.token)
+        self._replayed = bool(batches)
+        if batches:
+            # crash recovery: replay now, the snapshot balances predate the journal;
+            # the next save is a full rewrite (see load())
+            txs = journal.replay(self.segfile.replay(raw, entries), batches)
+            journal.replay_entities(accts, cats, batches)
+            self.segfile.synced = False
+            return LazyTransactions(lambda: txs, balances_current=False), accts, cats, applock
+        # with edits in the file a transaction's current version may live in any segment
+        adds_only = segments.adds_only(entries)
+
+        def load_range(start_iso: str, end_iso: str) -> Optional[List[Transaction]]:
+            if not adds_only:
+                return None
+            txs = self.segfile.replay(raw, segments.overlapping(entries, start_iso, end_iso))
+            res = [t for t in txs if _in_range(t, start_iso, end_iso)]
+            res.sort(key=lambda t: (t.datetime, t.id))
+            return res
+
+        return LazyTransactions(lambda: self.segfile.replay(raw, entries), load_range), accts, cats, applock
+
+    def save_meta(self, accts: List[Account], cats: List[Category], applock: AppLock) -> bool:
+        # a manifest-only append keeps every segment; needs the file exactly as opened
+        if self.fmt != FORMAT_SEGMENTED or not self.segfile.synced:
+            return False
+        self.segfile.append([], accts, cats, applock)
+        self._checkpointed(self.segfile.token)
+        return True
+
+    def _extra_path(self, name: str) -> str:
+        return f"{self.path}.{name}"
+
+    def save_extra(self, name: str, data: Dict) -> bool:
+        # encrypted sidecar file bound to the checkpoint token of the data file
+        try:
+            payload = json.dumps({"token": self.token.hex(), "data": data}, separators=(",", ":"))
+            utils.atomic_write_bytes(self._extra_path(name), self.keys.encrypt(payload.encode("utf-8")))
+            return True
+        except Exception:
+            return False
+
+    def load_extra(self, name: str) -> Optional[Dict]:
+        path = self._extra_path(name)
+        if self._replayed or not utils.file_exists(path):
+            return None
+        try:
+            stored = json.loads(self.keys.decrypt(utils.read_bytes(path)).decode("utf-8"))
+        except Exception:
+            return None
+        # a save since then (or a different data file) makes it stale
+        return stored["data"] if stored.get("token") == self.token.hex() else None
+
+    def _load_checkpoint(self) -> Tuple[List[Transaction], List[Account], List[Category], AppLock]:
+        self.token = bytes(journal.TOKEN_SIZE)
         if not utils.file_exists(self.path):
             # return empty
             return [], [], [], AppLock()
         raw = utils.read_bytes(self.path)
+        self.segfile.synced = False
+        if segments.is_segmented(raw):
+            try:
+                out = self.segfile.load(raw)
+            except Exception as e:
+                raise RuntimeError(f"Decrypt failed: {e}")
+            self.token = self.segfile.token
+            return out
         try:
-            plaintext = encryption.decrypt(raw, self.password)
+            plaintext = self.keys.decrypt(raw)
         except Exception as e:
             raise RuntimeError(f"Decrypt failed: {e}")
+        self.token = self._blob_token(raw)
+        if binfmt.is_binary(plaintext):
+            return binfmt.loads(plaintext)
         s = plaintext.decode("utf-8")
         bundle = DataBundle.from_json(s)
         txs = [Transaction.from_dict(t) for t in bundle.transactions]
@@ -35,18 +252,81 @@ class LocalStorage:
         applock = AppLock.from_dict(bundle.applock) if bundle.applock else AppLock()
         return txs, accts, cats, applock
 
-    def save(self, txs: List[Transaction], accts: List[Account], cats: List[Category], applock: AppLock) -> bool:
-        bundle = DataBundle(
-            transactions=[t.to_dict() for t in txs],
-            accounts=[a.to_dict() for a in accts],
-            categories=[c.to_dict() for c in cats],
-            applock=applock.to_dict()
-        )
-        txt = bundle.to_json().encode("utf-8")
-        blob = encryption.encrypt(txt, self.password)
-        utils.write_bytes(self.path, blob)
+    def save(self, txs: List[Transaction], accts: List[Account], cats: List[Category], applock: AppLock,
+             changes: Optional[List[segments.Change]] = None, checkpoint: bool = True) -> bool:
+        """changes: TransactionService.take_changes() since the last load/save. With the
+        segmented format only those are appended; None means unknown (full rewrite)."""
+        token = None
+        if not checkpoint:
+            # the new checkpoint's token, already announced to the journal; a nonce, so used once
+            token, self._next_token = self._next_token, None
+            if token is None:
+                raise RuntimeError("save(checkpoint=False) without begin_checkpoint()")
+        if self.fmt == FORMAT_SEGMENTED:
+            if changes is None or self.segfile.needs_compaction(len(changes)):
+                self.segfile.write_full(txs, accts, cats, applock, token)
+            else:
+                self.segfile.append(changes, accts, cats, applock, token)
+            self._saved(self.segfile.token, checkpoint)
+            return True
+        if self.fmt == FORMAT_BINARY:
+            txt = binfmt.dumps(txs, accts, cats, applock)
+        else:
+            bundle = DataBundle(
+                transactions=[t.to_dict() for t in txs],
+                accounts=[a.to_dict() for a in accts],
+                categories=[c.to_dict() for c in cats],
+                applock=applock.to_dict()
+            )
+            txt = bundle.to_json().encode("utf-8")
+        blob = self.keys.encrypt(txt, token)
+        utils.atomic_write_bytes(self.path, blob)
+        self.segfile.synced = False
+        self._saved(self._blob_token(blob), checkpoint)
         return True
 
+    @staticmethod
+    def _blob_token(blob: bytes) -> bytes:
+        # the random AES-GCM nonce of a single-blob file is unique per save
+        start = len(encryption.MAGIC) + encryption.SALT_SIZE
+        return bytes(blob[start:start + encryption.NONCE_SIZE])
+
+    def _saved(self, token: bytes, checkpoint: bool):
+        if checkpoint:
+            self._checkpointed(token)
+        else:
+            self._pending_token = token
+
+    def _checkpointed(self, token: bytes):
+        # the data file now holds everything; start a fresh journal against it
+        self.token = token
+        self._replayed = False
+        self.journal.reset(token)
+
+    def begin_checkpoint(self):
+        # the token is the nonce of the next manifest (or blob), picked before the write so
+        # the journal can follow both the old and the new checkpoint meanwhile
+        self._next_token = os.urandom(journal.TOKEN_SIZE)
+        self.journal.begin(self._next_token)
+
+    def finish_checkpoint(self, changes_since: List[segments.Change]):
+        token = self._pending_token
+        if self.journal.next is not None and self.journal.next.token == token:
+            # changes_since went to the new checkpoint's journal as they happened
+            self.token = token
+            self._replayed = False
+            self.journal.promote()
+            return
+        self._checkpointed(token)
+        for change in changes_since:
+            self.journal.append(change)
+        self.journal.commit()
+
+    def close(self):
+        self.journal.close()
+        # drop cached key material
+        self.keys.clear()
+
     def backup(self, backup_path: str) -> bool:
         try:
             utils.ensure_dir(os.path.dirname(os.path.abspath(backup_path)) or ".")
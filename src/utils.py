@@ -5,7 +5,12 @@ import uuid
 from datetime import datetime, timezone
 import os
 import csv
-from typing import List
+import tempfile
+from itertools import islice
+from typing import List, Iterable, Iterator, Callable, Optional
+
+CSV_HEADER = ["id", "type", "amount", "category", "account", "datetime", "remark", "receipt"]
+CSV_CHUNK_SIZE = 5000
 
 
 def generate_uuid() -> str:
@@ -31,6 +36,37 @@ def write_bytes(path: str, data: bytes) -> None:
         f.write(data)
 
 
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    # temp file in the same directory + fsync + rename: readers see either the old or the new file
+    d = os.path.dirname(os.path.abspath(path)) or "."
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=d)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    fsync_dir(d)
+
+
+def fsync_dir(path: str) -> None:
+    # make a rename durable; not supported on every platform (e.g. Windows)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
@@ -40,29 +76,43 @@ def escape_csv_field(s: str) -> str:
     return s
 
 
-def write_transactions_csv(path: str, rows: List[dict]):
-    # rows: list of dict contains id,type,amount,category,account,datetime,remark,receipt
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(path: str, header: List[str], rows: Iterable[dict], chunk_size: int = CSV_CHUNK_SIZE,
+              progress: Optional[Callable[[int], None]] = None) -> int:
+    # rows are consumed chunk by chunk so a generator never has to be materialized
     ensure_dir(os.path.dirname(os.path.abspath(path)) or ".")
+    count = 0
     with open(path, "w", newline='', encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow(["id", "type", "amount", "category", "account", "datetime", "remark", "receipt"])
-        for r in rows:
-            writer.writerow([
-                r.get("id", ""),
-                r.get("type", ""),
-                r.get("amount", ""),
-                r.get("category", ""),
-                r.get("account", ""),
-                r.get("datetime", ""),
-                r.get("remark", ""),
-                r.get("receipt", "")
-            ])
+        writer.writerow(header)
+        for chunk in chunked(rows, chunk_size):
+            writer.writerows([r.get(k, "") for k in header] for r in chunk)
+            count += len(chunk)
+            if progress:
+                progress(count)
+    return count
 
 
-def read_transactions_csv(path: str):
-    out = []
+def write_transactions_csv(path: str, rows: Iterable[dict], chunk_size: int = CSV_CHUNK_SIZE,
+                           progress: Optional[Callable[[int], None]] = None) -> int:
+    # rows: iterable of dicts with id,type,amount,category,account,datetime,remark,receipt
+    return write_csv(path, CSV_HEADER, rows, chunk_size, progress)
+
+
+def iter_transactions_csv(path: str) -> Iterator[dict]:
     with open(path, "r", newline='', encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            out.append(row)
-    return out
\ No newline at end of file
+            yield row
+
+
+def read_transactions_csv(path: str):
+    return list(iter_transactions_csv(path))